@@ -499,18 +499,75 @@ if __name__ == '__main__':
 
 
 
+import io
 import os
-import pandas as pd
-from flask import Flask, request, jsonify, render_template, send_file
+import shutil
+import time
+import uuid
+import zipfile
+from flask import Flask, request, jsonify, render_template, send_file, Response
 from werkzeug.utils import secure_filename
-from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
+
+from validation import ENGINE_VERSION
+from rules import RULES, RULES_DIGEST, select_rules, rules_version
+from workbook import sheet_info, write_highlighted, write_sheets
+from sessions import new_session, store_session, get_session, session_source
+from jobs import DONE, submit_job, done_job, get_job, job_status, job_progress, wait_progress, progress
+from findings import KINDS, parse_query, query_results, result_summary
+from parallel import PROCESS_WORKERS, check_sheet, check_sheets
+from batch import iter_workbooks, bounded_map, result_name
+from cache import cache_key, cache_lookup, cache_store, cache_stats
+import metrics
+from metrics import stage
 
 app = Flask(__name__)
 UPLOAD_FOLDER = 'uploads'
 RESULT_FOLDER = 'results'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULT_FOLDER, exist_ok=True)
+DEFAULT_RADIUS_M = 10
+# Au-delà, la feuille est lue par blocs (streaming.py) plutôt qu'en entier
+STREAMING_MIN_BYTES = 20 * 1024 * 1024
+# Flux d'avancement (/jobs/<id>/events) : commentaire toutes les
+# EVENTS_HEARTBEAT secondes sans changement (proxys), flux refermé après
+# EVENTS_MAX_SECONDS (le navigateur se reconnecte de lui-même)
+EVENTS_HEARTBEAT = 15
+EVENTS_MAX_SECONDS = 5 * 60
+
+
+@app.before_request
+def start_timings():
+    if metrics.ENABLED:
+        metrics.begin_timings()
+
+
+@app.after_request
+def add_server_timing(response):
+    timings = metrics.end_timings() if metrics.ENABLED else None
+    if timings:
+        header = metrics.server_timing(timings)
+        if response.headers.get('Server-Timing'):
+            header = response.headers['Server-Timing'] + ', ' + header
+        response.headers['Server-Timing'] = header
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    extra = {f'cache_{name}_total': value for name, value in cache_stats().items()}
+    return Response(metrics.render(extra), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/rules', methods=['GET'])
+def list_rules():
+    # Règles de rules.yaml, à choisir par requête : /process rules=id1,id2
+    return jsonify({'rules': [{
+        'id': rule['id'],
+        'type': rule['type'],
+        'column': rule['column'],
+        'reference': rule['reference'],
+        'enabled': rule['enabled']
+    } for rule in RULES]})
 
 
 @app.route('/')
@@ -523,48 +580,260 @@ def get_sheets():
     if not file:
         return jsonify({'error': 'No file provided'}), 400
 
-    filename = secure_filename(file.filename)
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(file_path)
+    # Le fichier reste en mémoire : /process le retrouve grâce au jeton
+    with stage('upload'):
+        session = new_session(secure_filename(file.filename), file.read())
+    metrics.inc('upload_bytes_total', len(session['data']))
 
     try:
-        wb = load_workbook(file_path, read_only=True)
-        sheet_names = wb.sheetnames
-        wb.close()
-        os.remove(file_path)  # Clean up the temporary file
-        return jsonify({'sheets': sheet_names})
+        # Métadonnées seulement : aucune cellule n'est lue
+        with stage('metadata'):
+            details = sheet_info(session_source(session))
+        return jsonify({
+            'sheets': [sheet['name'] for sheet in details],
+            'details': details,
+            'size': len(session['data']),
+            'token': store_session(session)
+        })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 @app.route('/process', methods=['POST'])
 def process_file():
     file = request.files.get('file')
+    token = request.form.get('token')
     action = request.form.get('action')
     sheet_name = request.form.get('sheet_name')
-    if not file or not action or not sheet_name or sheet_name == 'null':
+    # Plusieurs feuilles en une requête : sheets=F1&sheets=F2, ou sheets=* (toutes)
+    sheets = [name for name in request.form.getlist('sheets') if name]
+    if sheets:
+        sheet_name = None
+    if not (file or token) or not action or not (sheets or sheet_name) or sheet_name == 'null':
         return jsonify({'error': 'Fichier, action ou nom de feuille manquant'}), 400
+    if action not in ACTIONS:
+        return jsonify({'error': 'Action inconnue'}), 400
+    try:
+        radius, rules = _options(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if file:
+        with stage('upload', action):
+            session = new_session(secure_filename(file.filename), file.read())
+        metrics.inc('upload_bytes_total', len(session['data']))
+    else:
+        session = get_session(token)
+        if session is None:
+            return jsonify({'error': 'Session expirée, veuillez renvoyer le fichier'}), 410
 
-    filename = secure_filename(file.filename)
-    upload_path = os.path.join(UPLOAD_FOLDER, filename)
+    if sheets:
+        try:
+            sheets = _sheet_names(session, sheets)
+        except Exception as e:
+            return jsonify({'error': str(e)}), 400
+
+    # Lecture par blocs : demandée (streaming=1) ou imposée par la taille
+    streaming = request.form.get('streaming') == '1' or len(session['data']) >= STREAMING_MIN_BYTES
+    # Revalidation incrémentale (history.py) : erreurs des feuilles lues
+    # en entier
+    incremental = request.form.get('incremental') == '1' and action != 'detect_duplicates' and not streaming
+    # Registre des sites (registry.py) : doublons avec les fichiers déjà
+    # contrôlés, feuilles lues en entier
+    registry = request.form.get('registry') == '1' and action != 'detect_errors' and not streaming
+
+    filename = session['filename']
     result_path = os.path.join(RESULT_FOLDER, f"{os.path.splitext(filename)[0]}_corrigé.xlsx")
-    file.save(upload_path)
 
+    # Fichier déjà analysé (même contenu, même feuille, même action). Avec
+    # le registre ou la revalidation incrémentale, la réponse dépend des
+    # envois précédents (et les met à jour) : pas de cache. Plusieurs
+    # feuilles : clé distincte de celle d'une seule feuille, même si la
+    # liste n'en compte qu'une (résultats avec « Feuille » et « sheets »).
+    key = cached = None
+    if not (registry or incremental):
+        with stage('cache_lookup', action):
+            # Règles de doublons et de cohérence : rules.yaml
+            version = ENGINE_VERSION + '-' + (RULES_DIGEST if action == 'detect_duplicates' else rules_version(rules))
+            key = cache_key(session, 'sheets:' + '\x1f'.join(sheets) if sheets else sheet_name, action, version,
+                            radius)
+            cached = cache_lookup(key, result_path)
+    if cached is not None:
+        # Traitement terminé d'emblée, lisible sur /jobs/<id> et
+        # /results/<id> ; lines=0 : sans les lignes (l'interface les lit
+        # page par page)
+        result = {'results': cached, 'file': os.path.basename(result_path)}
+        job_id = done_job(result)
+        if request.form.get('lines') == '0':
+            return jsonify({'job': job_id})
+        return jsonify(dict(result, job=job_id))
+
+    # Traitement en arrière-plan : l'état se lit sur /jobs/<id>
+    if sheets:
+        job_id = submit_job(run_sheets, action, session, result_path, sheets, radius, key, streaming, rules,
+                            incremental, registry)
+    else:
+        job_id = submit_job(run_action, action, session, result_path, sheet_name, radius, key, streaming, rules,
+                            incremental, registry)
+    return jsonify({'job': job_id}), 202
+
+
+ACTIONS = ('detect_errors', 'detect_duplicates', 'all')
+
+
+def _options(form):
+    # Mode « proche » : doublons à moins de radius mètres
+    radius = None
+    if form.get('mode') == 'near':
+        try:
+            radius = float(form.get('radius', DEFAULT_RADIUS_M))
+        except ValueError:
+            radius = 0
+        if not radius > 0:
+            raise ValueError('Rayon invalide')
+
+    # Règles demandées (rules=2G-tilt,3G-azim), sinon celles actives par défaut
+    rules = select_rules([r.strip() for r in form.get('rules', '').split(',') if r.strip()])
+    return radius, rules
+
+
+def _sheet_names(session, sheets):
+    # sheets : noms demandés, ou ['*'] pour toutes les feuilles du classeur
+    names = [sheet['name'] for sheet in sheet_info(session_source(session))]
+    if sheets == ['*']:
+        return names
+    unknown = [name for name in sheets if name not in names]
+    if unknown:
+        raise ValueError('Feuilles inconnues : ' + ', '.join(unknown))
+    return list(dict.fromkeys(sheets))
+
+
+@app.route('/batch', methods=['POST'])
+def batch_process():
+    # Plusieurs classeurs en une requête : files=... (classeurs .xlsx et/ou
+    # archives .zip), mêmes options que /process. Résultat : un résumé par
+    # classeur et une archive .zip des classeurs colorés.
+    files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f and f.filename]
+    action = request.form.get('action')
+    if not files or not action:
+        return jsonify({'error': 'Fichiers ou action manquants'}), 400
+    if action not in ACTIONS:
+        return jsonify({'error': 'Action inconnue'}), 400
     try:
-        if action == 'detect_errors':
-            result, error_list = detect_errors(upload_path, result_path, sheet_name)
-            return jsonify({
-                'results': {'errors': error_list},
-                'file': os.path.basename(result_path)
-            })
-        elif action == 'detect_duplicates':
-            result, doublons = detect_duplicates(upload_path, result_path, sheet_name)
-            return jsonify({
-                'results': {'doublons': doublons},
-                'file': os.path.basename(result_path)
-            })
+        radius, rules = _options(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    # Feuilles à contrôler dans chaque classeur (toutes par défaut)
+    sheets = [name for name in request.form.getlist('sheets') if name] or ['*']
+
+    # Envois écrits sur disque, pas gardés en mémoire
+    batch_id = uuid.uuid4().hex
+    folder = os.path.join(UPLOAD_FOLDER, 'lot_' + batch_id)
+    os.makedirs(folder)
+    uploads = []
+    with stage('upload', 'batch'):
+        for k, file in enumerate(files):
+            path = os.path.join(folder, str(k))
+            file.save(path)
+            uploads.append((secure_filename(file.filename) or f'fichier{k}', path))
+            metrics.inc('upload_bytes_total', os.path.getsize(path), 'batch')
+
+    result_path = os.path.join(RESULT_FOLDER, f"lot_{batch_id[:12]}_corrigé.zip")
+    job_id = submit_job(run_batch, action, uploads, folder, result_path, sheets, radius, rules)
+    return jsonify({'job': job_id}), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_info(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Traitement inconnu'}), 404
+    status = job_status(job)
+    # lines=0 : nombres seulement, les lignes se lisent page par page sur
+    # /results/<id>
+    if request.args.get('lines') == '0' and job['state'] == DONE:
+        status['results'] = {name: value for name, value in status['results'].items() if name not in KINDS}
+        status['summary'] = result_summary(job)
+    response = jsonify(status)
+    # Étapes du traitement lui-même (exécuté hors requête)
+    if job['timings']:
+        response.headers['Server-Timing'] = metrics.server_timing(job['timings'])
+    return response
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    # Server-Sent Events : « progress » à chaque changement (étape, lignes
+    # contrôlées, nombres trouvés, premières erreurs), puis « done » ; le
+    # résultat complet se lit ensuite sur /jobs/<id>
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Traitement inconnu'}), 404
+    return Response(_events(job), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/results/<job_id>', methods=['GET'])
+def job_results(job_id):
+    # Lignes trouvées, page par page : kind=errors|doublons|registre,
+    # filtres generation=2G,3G field=tilt column=... sheet=... row_min /
+    # row_max, tri sort=Ligne (-Ligne : décroissant), cursor (champ next de
+    # la page précédente), limit
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Traitement inconnu'}), 404
+    if job['state'] != DONE:
+        return jsonify({'error': job['error'] or 'Traitement non terminé', 'state': job['state']}), 409
+    try:
+        page = query_results(job, *parse_query(request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(dict(page, job=job_id))
+
+
+def _event(name, data):
+    return f"event: {name}\ndata: {app.json.dumps(data)}\n\n"
+
+
+def _events(job):
+    deadline = time.monotonic() + EVENTS_MAX_SECONDS
+    version = None
+    while time.monotonic() < deadline:
+        current = job['version']
+        if current != version:
+            version = current
+            finished = job['finished'] is not None
+            yield _event('progress', job_progress(job))
+            if finished:
+                yield _event('done', {'job': job['id'], 'state': job['state']})
+                return
         else:
-            return jsonify({'error': 'Action inconnue'}), 400
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+            yield ": keep-alive\n\n"
+        wait_progress(job, version, EVENTS_HEARTBEAT)
+
+
+def run_action(action, session, result_path, sheet_name, radius, key, streaming=False, rules=None,
+               incremental=False, registry=False):
+    result, results = detect_sheet(action, session, result_path, sheet_name, radius, streaming, rules, incremental,
+                                   registry)
+    if key is not None:
+        with stage('cache_store', action):
+            cache_store(key, results, result)
+    return {
+        'results': results,
+        'file': os.path.basename(result_path)
+    }
+
+
+def run_sheets(action, session, result_path, sheets, radius, key, streaming=False, rules=None, incremental=False,
+               registry=False):
+    result, results = detect_sheets(action, session, result_path, sheets, radius, streaming, rules,
+                                    incremental=incremental, registry=registry)
+    if key is not None:
+        with stage('cache_store', action):
+            cache_store(key, results, result)
+    return {
+        'results': results,
+        'file': os.path.basename(result_path)
+    }
 
 
 @app.route('/download', methods=['POST'])
@@ -580,141 +849,162 @@ def download_file():
 
 
 # ----------------------
-# LOGIQUE : DÉTECTION D'ERREURS
+# LOGIQUE : UNE FEUILLE
 # ----------------------
-def detect_errors(input_path, output_path, sheet_name):
-    header_row = 1
-    data_start_row = 2
-    df = pd.read_excel(input_path, sheet_name=sheet_name, header=header_row)
-    df.columns = [str(col).strip() for col in df.columns]
-
-    cols = {
-        '2G': {
-            'freq': "fréquences d'émission",
-            'tilt': "Tits mécanques et électriques de chaque antenne",
-            'pire': "Puissance isotrope rayonnée équivalente (PIRE) dans chaque secteur",
-            'ant': "Nombre d'antennes",
-            'azim': "azimut du rayonnement maximum dans chaque secteur"
-        },
-        '3G': {
-            'tilt': "Tits mécanques et électriques de chaque antenne.1",
-            'pire': "Puissance isotrope rayonnée équivalente (PIRE) dans chaque secteur.1",
-            'ant': "Nombre d'antennes MIMO",
-            'azim': "Azimut du rayonnement maximum dans chaque secteur"
-        },
-        '4G': {
-            'tilt': "Tits mécanques et électriques de chaque antenne.2",
-            'pire': "Puissance isotrope rayonnée équivalente (PIRE) dans chaque secteur.2",
-            'ant': "Nombre d'antennes MIMO.1",
-            'azim': "Azimut du rayonnement maximum dans chaque secteur.1"
-        }
-    }
-
-    def parse_values(value):
-        if pd.isna(value) or str(value).strip() in ['', 'nan']:
-            return None
-        try:
-            parts = str(value).replace(',', '.').split('/')
-            return [float(x.strip()) for x in parts if x.strip()]
-        except ValueError:
-            return None
+# Contrôles de la feuille (parallel.check_sheet, les mêmes que pour
+# plusieurs feuilles et pour les lots), puis un seul classeur en sortie :
+# lignes en erreur en rouge, doublons en vert (le rouge l'emporte sur une
+# ligne signalée deux fois), sites du registre en bleu. Une feuille de
+# rapport par contrôle quand les deux sont demandés, et pour le registre.
+ERROR_COLOR = "FF9999"
+ERROR_REPORT = ("Erreurs", ["Ligne", "Colonne", "Valeur", "Problème"])
+DUPLICATE_COLOR = "00FF00"
+DUPLICATE_REPORT = ("Doublons", ["Groupe", "Règle", "Ligne", "Identifiant", "Latitude", "Longitude", "Valeur"])
+REGISTRY_COLOR = "99CCFF"
+REGISTRY_REPORT = ("Registre", ["Ligne", "Identifiant", "Latitude", "Longitude", "Identifiant connu", "Source",
+                                "Distance (m)"])
+
+
+def detect_sheet(action, session, output_path, sheet_name, radius=None, streaming=False, rules=None,
+                 incremental=False, registry=False):
+    results = check_sheet(session, sheet_name, action, radius, rules, streaming, incremental, registry)
+    if action == 'detect_errors' and not results['errors']:
+        return None, results  # Si aucun problème
+
+    highlights = []
+    reports = []
+    if 'errors' in results:
+        highlights.append(([err["Ligne"] for err in results['errors']], ERROR_COLOR))
+    if 'doublons' in results:
+        highlights.append(([dup["Ligne"] for dup in results['doublons']], DUPLICATE_COLOR))
+    if action == 'all':
+        reports += [ERROR_REPORT + (results['errors'],), DUPLICATE_REPORT + (results['doublons'],)]
+    if 'registre' in results:
+        highlights.append(([line["Ligne"] for line in results['registre']], REGISTRY_COLOR))
+        reports.append(REGISTRY_REPORT + (results['registre'],))
+    with stage('highlight', action):
+        write_highlighted(session_source(session), output_path, sheet_name, highlights, reports)
+    return output_path, results
 
-    error_lines = []
 
-    for idx, row in df.iterrows():
-        errors = []
-        freq_2g = parse_values(row[cols['2G']['freq']])
-        if not freq_2g:
+# ----------------------
+# LOGIQUE : PLUSIEURS FEUILLES
+# ----------------------
+# Les feuilles sont contrôlées en parallèle (parallel.py, un processus par
+# feuille). Résultats fusionnés : chaque ligne signalée porte le nom de sa
+# feuille (« Feuille »), et « sheets » résume chaque feuille (nombres
+# trouvés, ou l'erreur qui l'a empêchée). Un seul classeur en sortie, toutes
+# les feuilles colorées, avec une feuille de rapport par contrôle.
+def detect_sheets(action, session, output_path, sheets, radius=None, streaming=False, rules=None, in_process=None,
+                  incremental=False, registry=False):
+    with stage('sheets', action):
+        outcomes = check_sheets(session, sheets, action, radius, rules, streaming, in_process, incremental,
+                                registry)
+
+    results = {}
+    if action != 'detect_duplicates':
+        results['errors'] = []
+    if action != 'detect_errors':
+        results['doublons'] = []
+    if registry:
+        results['registre'] = []
+    results['sheets'] = []
+    highlights = {}
+    for sheet_name, outcome in outcomes:
+        if isinstance(outcome, Exception):
+            results['sheets'].append({'Feuille': sheet_name, 'error': str(outcome)})
             continue
+        summary = {'Feuille': sheet_name}
+        highlights[sheet_name] = []
+        for name, color in (('errors', ERROR_COLOR), ('doublons', DUPLICATE_COLOR), ('registre', REGISTRY_COLOR)):
+            if name in outcome:
+                lines = [{'Feuille': sheet_name, **line} for line in outcome[name]]
+                results[name] += lines
+                summary[name] = len(lines)
+                highlights[sheet_name].append(([line["Ligne"] for line in lines], color))
+        for name in ('doublons_ignores', 'incremental'):
+            if name in outcome:
+                summary[name] = outcome[name]
+        if 'incremental' in outcome:
+            totals = results.setdefault('incremental', {'reused': 0, 'recomputed': 0})
+            for name, count in outcome['incremental'].items():
+                totals[name] += count
+        results['sheets'].append(summary)
+    # Nombres de toutes les feuilles (les feuilles lues par blocs sur place
+    # en ont déjà compté une partie)
+    progress(**{name: len(results[name]) for name in ('errors', 'doublons') if name in results})
+
+    if not highlights:
+        raise ValueError('; '.join(f"{sheet['Feuille']} : {sheet['error']}" for sheet in results['sheets']))
+
+    reports = []
+    if 'errors' in results:
+        reports.append(_sheet_report(ERROR_REPORT, results['errors']))
+    if 'doublons' in results:
+        reports.append(_sheet_report(DUPLICATE_REPORT, results['doublons']))
+    if 'registre' in results:
+        reports.append(_sheet_report(REGISTRY_REPORT, results['registre']))
+    with stage('highlight', action):
+        write_sheets(session_source(session), output_path, highlights, reports)
+    return output_path, results
 
-        ref_count = len(freq_2g)
-        ref_azim = parse_values(row[cols['2G']['azim']])
-
-        for gen in ['2G', '3G', '4G']:
-            for field in ['tilt', 'pire', 'ant']:
-                val = parse_values(row[cols[gen][field]])
-                if val and len(val) != ref_count:
-                    errors.append({
-                        "Ligne": idx + data_start_row + 1,
-                        "Colonne": cols[gen][field],
-                        "Valeur": row[cols[gen][field]],
-                        "Problème": f"{gen} - {field}: {len(val)} ≠ {ref_count}"
-                    })
-            azim = parse_values(row[cols[gen]['azim']])
-            if azim and ref_azim and azim != ref_azim:
-                errors.append({
-                    "Ligne": idx + data_start_row + 1,
-                    "Colonne": cols[gen]['azim'],
-                    "Valeur": row[cols[gen]['azim']],
-                    "Problème": f"{gen} - azimut ≠ 2G"
-                })
-
-        if errors:
-            error_lines.extend(errors)
-
-    # Coloration si erreur
-    if error_lines:
-        wb = load_workbook(input_path)
-        ws = wb[sheet_name]
-        red_fill = PatternFill(start_color="FF9999", end_color="FF9999", fill_type="solid")
-        for err in error_lines:
-            row_num = err["Ligne"]
-            for row in ws.iter_rows(min_row=row_num, max_row=row_num):
-                for cell in row:
-                    cell.fill = red_fill
-        wb.save(output_path)
-    else:
-        output_path = input_path  # Si aucun problème
 
-    return output_path, error_lines
+def _sheet_report(report, lines):
+    title, columns = report
+    return title, ['Feuille'] + columns, lines
 
 
 # ----------------------
-# LOGIQUE : DÉTECTION DE DOUBLONS
+# LOGIQUE : LOTS DE CLASSEURS
 # ----------------------
-def detect_duplicates(input_path, output_path, sheet_name):
-    df = pd.read_excel(input_path, sheet_name=sheet_name, header=2)
-    df = df.rename(columns={
-        df.columns[0]: 'Identifiant',
-        df.columns[4]: 'Longitude',
-        df.columns[5]: 'Latitude'
-    })
-
-    df['Latitude'] = pd.to_numeric(df['Latitude'], errors='coerce')
-    df['Longitude'] = pd.to_numeric(df['Longitude'], errors='coerce')
-    df_coords = df.dropna(subset=['Latitude', 'Longitude'])
-
-    groupes = df_coords.groupby(['Latitude', 'Longitude'])['Identifiant'].agg(['count', 'nunique'])
-    doublons = groupes[groupes['nunique'] > 1]
-    lignes_doublons = []
-
-    for (lat, lon), _ in doublons.iterrows():
-        mask = (df_coords['Latitude'] == lat) & (df_coords['Longitude'] == lon)
-        lignes_doublons.extend(df_coords[mask].index.tolist())
-
-    results = []
-    for idx in lignes_doublons:
-        row = df.iloc[idx]
-        results.append({
-            "Ligne": idx + 4,
-            "Identifiant": row['Identifiant'],
-            "Latitude": row['Latitude'],
-            "Longitude": row['Longitude']
-        })
-
-    # Colorier les lignes trouvées
-    wb = load_workbook(input_path)
-    ws = wb[sheet_name]
-    green_fill = PatternFill(start_color="00FF00", end_color="00FF00", fill_type="solid")
-
-    for idx in lignes_doublons:
-        row_num = idx + 4
-        for row in ws.iter_rows(min_row=row_num, max_row=row_num):
-            for cell in row:
-                cell.fill = green_fill
-
-    wb.save(output_path)
-    return output_path, results
+# Chaque classeur du lot est traité comme /process avec plusieurs feuilles
+# (detect_sheets), au plus BATCH_WORKERS à la fois (batch.py) ; ses
+# feuilles partent toujours dans le pool de processus, même s'il n'en a
+# qu'une. Un classeur en échec est noté dans le résumé, le lot continue.
+# Les classeurs colorés sont ajoutés à l'archive dès qu'ils sont prêts.
+def check_workbook(action, workbook, sheets, radius=None, rules=None):
+    name, data = workbook
+    if isinstance(data, Exception):
+        raise data
+    session = new_session(name, data)
+    output = io.BytesIO()
+    _, results = detect_sheets(action, session, output, _sheet_names(session, sheets), radius,
+                               len(data) >= STREAMING_MIN_BYTES, rules, in_process=PROCESS_WORKERS == 1)
+    return output.getvalue(), results
+
+
+def run_batch(action, uploads, folder, result_path, sheets, radius=None, rules=None):
+    rules = select_rules() if rules is None else rules
+    files = []
+    totals = {}
+    used = set()
+    workbooks = enumerate(iter_workbooks(uploads))
+    try:
+        with stage('batch', action), zipfile.ZipFile(result_path, 'w', zipfile.ZIP_DEFLATED) as zout:
+            for (k, (name, _)), outcome in bounded_map(
+                    lambda item: check_workbook(action, item[1], sheets, radius, rules), workbooks):
+                if isinstance(outcome, Exception):
+                    files.append((k, {'Fichier': name, 'error': str(outcome)}))
+                    continue
+                workbook, results = outcome
+                arcname = result_name(name, used)
+                zout.writestr(arcname, workbook)
+                summary = {'Fichier': name, 'Résultat': arcname, 'sheets': results['sheets']}
+                for key in ('errors', 'doublons'):
+                    if key in results:
+                        summary[key] = len(results[key])
+                        totals[key] = totals.get(key, 0) + len(results[key])
+                files.append((k, summary))
+                progress(files=len(files), **totals)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    # Résumé dans l'ordre d'envoi
+    files = [summary for _, summary in sorted(files, key=lambda entry: entry[0])]
+    return {
+        'results': dict(totals, files=files, failed=sum('error' in summary for summary in files)),
+        'file': os.path.basename(result_path)
+    }
 
 
 if __name__ == '__main__':
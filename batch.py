@@ -0,0 +1,108 @@
+import os
+import posixpath
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+
+from parallel import PROCESS_WORKERS
+
+
+# ----------------------
+# LOTS DE CLASSEURS (/batch)
+# ----------------------
+# Les fichiers envoyés (classeurs .xlsx, ou archives .zip de classeurs) sont
+# d'abord écrits sur disque. Les classeurs sont ensuite extraits un à un, au
+# moment où un traitement se libère : au plus BATCH_WORKERS classeurs sont
+# en mémoire à la fois, quelle que soit la taille du lot. Les contrôles
+# eux-mêmes passent par le pool de processus (parallel.py).
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 0)) or PROCESS_WORKERS
+MAX_WORKBOOK_BYTES = 256 * 1024 * 1024  # par classeur, une fois extrait
+
+# Lecture impossible d'un membre de l'archive (corrompu, chiffré, méthode
+# de compression inconnue)
+MEMBER_ERRORS = (zipfile.BadZipFile, NotImplementedError, RuntimeError, OSError, EOFError)
+
+
+def _wanted(name):
+    # Classeurs seulement : ni dossiers, ni métadonnées macOS, ni fichiers
+    # de verrouillage d'Excel (~$classeur.xlsx)
+    base = posixpath.basename(name)
+    return (name.lower().endswith('.xlsx') and not base.startswith('~$')
+            and not name.startswith('__MACOSX/'))
+
+
+def iter_workbooks(uploads):
+    # uploads : [(nom envoyé, chemin sur disque)] ; donne (nom, octets) ou
+    # (nom, exception) pour chaque classeur, dans l'ordre d'envoi
+    for filename, path in uploads:
+        if filename.lower().endswith('.zip'):
+            try:
+                zin = zipfile.ZipFile(path)
+            except zipfile.BadZipFile:
+                yield filename, ValueError('Archive .zip illisible')
+                continue
+            with zin:
+                for info in zin.infolist():
+                    if info.is_dir() or not _wanted(info.filename):
+                        continue
+                    if info.file_size > MAX_WORKBOOK_BYTES:
+                        yield info.filename, ValueError('Classeur trop volumineux')
+                        continue
+                    try:
+                        data = zin.read(info)
+                    except MEMBER_ERRORS as e:
+                        data = ValueError(f'Extraction impossible : {e}')
+                    yield info.filename, data
+        elif filename.lower().endswith('.xlsx'):
+            if os.path.getsize(path) > MAX_WORKBOOK_BYTES:
+                yield filename, ValueError('Classeur trop volumineux')
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            yield filename, data
+        else:
+            yield filename, ValueError('Fichier ni .xlsx ni .zip')
+
+
+def bounded_map(func, items, workers=None):
+    # func(item) sur un pool de threads, au plus workers en cours : items
+    # n'est consommé qu'au fur et à mesure. Donne (item, résultat ou
+    # exception) dans l'ordre où les traitements se terminent.
+    workers = workers or BATCH_WORKERS
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch') as executor:
+        pending = {}
+        while True:
+            # Place libre d'abord : l'élément suivant (un classeur lu en
+            # entier) n'est tiré qu'ensuite
+            if len(pending) >= workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield _outcome(pending.pop(future), future)
+            item = next(items, _END)
+            if item is _END:
+                break
+            pending[executor.submit(func, item)] = item
+        for future in as_completed(list(pending)):
+            yield _outcome(pending.pop(future), future)
+
+
+_END = object()
+
+
+def _outcome(item, future):
+    try:
+        return item, future.result()
+    except Exception as e:
+        return item, e
+
+
+def result_name(name, used):
+    # "dossier/Opérateur A.xlsx" -> "Opérateur A_corrigé.xlsx", sans doublon
+    # dans l'archive de résultats
+    stem = os.path.splitext(posixpath.basename(name))[0]
+    arcname, k = f"{stem}_corrigé.xlsx", 1
+    while arcname in used:
+        k += 1
+        arcname = f"{stem} ({k})_corrigé.xlsx"
+    used.add(arcname)
+    return arcname
@@ -0,0 +1,193 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+
+from generate import SHEET_NAME, make_workbook  # noqa: E402
+
+
+# ----------------------
+# BENCHMARKS
+# ----------------------
+# Chaque étape (lecture, contrôles, coloration + écriture) est chronométrée
+# seule, puis la route /process de bout en bout via le client de test Flask
+# (cache vide, puis cache rempli). Le pic mémoire Python de chaque étape est
+# mesuré par tracemalloc lors d'un passage à part, pour ne pas fausser les
+# temps. La lecture (colonnes repérées par schema.py) est mesurée avec
+# chaque lecteur (readers.READERS), et comparée à la lecture de la feuille
+# entière. Résultats en JSON, comparables
+# d'une exécution à l'autre.
+def _timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _stage(results, name, func, repeat, memory):
+    seconds, value = _timed(func, repeat)
+    results[name] = {'seconds': round(seconds, 4)}
+    if memory:
+        results[name]['peak_bytes'] = _peak_memory(func)
+    print(f"  {name:<30} {seconds:8.3f} s", flush=True)
+    return value
+
+
+def _http(client, data, action):
+    response = client.post('/process', data={
+        'file': (io.BytesIO(data), 'bench.xlsx'),
+        'action': action,
+        'sheet_name': SHEET_NAME
+    })
+    while response.status_code == 202 or response.get_json().get('state') in ('en_attente', 'en_cours'):
+        time.sleep(0.01)
+        response = client.get('/jobs/' + response.get_json()['job'])
+    if response.get_json().get('error'):
+        raise RuntimeError(response.get_json()['error'])
+    return response.get_json()
+
+
+def run(path, repeat=3, memory=True):
+    # Imports après le chdir : app.py crée uploads/ results/ dans le dossier courant
+    import app
+    import cache
+    from readers import READERS, read_sheet
+    from schema import sheet_schema, read_columns
+    from validation import find_errors, find_duplicates
+    from workbook import write_highlighted
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    output = os.path.join(app.RESULT_FOLDER, 'bench_corrigé.xlsx')
+
+    stages = {}
+    schema = _stage(stages, 'schema', lambda: sheet_schema(io.BytesIO(data), SHEET_NAME), repeat, memory)
+    for reader in READERS:
+        _stage(stages, f'read_sheet[{reader}]', lambda: read_sheet(
+            io.BytesIO(data), SHEET_NAME, schema['header'], reader=reader), repeat, memory)
+    df = _stage(stages, 'read_columns', lambda: read_columns(io.BytesIO(data), SHEET_NAME, schema), repeat, memory)
+    errors = _stage(stages, 'validate_errors', lambda: find_errors(df, schema['first_row']), repeat, memory)
+    _stage(stages, 'highlight_errors', lambda: write_highlighted(
+        io.BytesIO(data), output, SHEET_NAME, [([e["Ligne"] for e in errors], "FF9999")]), repeat, memory)
+
+    doublons = _stage(stages, 'validate_duplicates', lambda: find_duplicates(df, schema['first_row']), repeat, memory)
+    _stage(stages, 'highlight_duplicates', lambda: write_highlighted(
+        io.BytesIO(data), output, SHEET_NAME, [([d["Ligne"] for d in doublons], "00FF00")]), repeat, memory)
+
+    # De bout en bout : chaque passage « à froid » vide le cache des résultats
+    client = app.app.test_client()
+    for action in ('detect_errors', 'detect_duplicates', 'all'):
+        def cold():
+            shutil.rmtree(cache.CACHE_FOLDER, ignore_errors=True)
+            return _http(client, data, action)
+        _stage(stages, f'http_{action}', cold, repeat, False)
+        _stage(stages, f'http_{action}_cached', lambda: _http(client, data, action), repeat, False)
+
+    return {
+        'rows': len(df),
+        'bytes': len(data),
+        'errors': len(errors),
+        'doublons': len(doublons),
+        'stages': stages
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks des contrôles et de /process")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--duplicate-rate', type=float, default=0.02)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help="sans mesure tracemalloc")
+    parser.add_argument('--workbook', help="classeur existant à la place des classeurs générés")
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results',
+                                                         datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.json'))
+    parser.add_argument('--compare', help="résultats JSON d'une exécution précédente")
+    args = parser.parse_args()
+    workbook = os.path.abspath(args.workbook) if args.workbook else None
+    output = os.path.abspath(args.output)
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    os.chdir(workdir)
+    try:
+        runs = []
+        sizes = [None] if workbook else args.rows
+        for rows in sizes:
+            path = workbook or os.path.join(workdir, f'bench_{rows}.xlsx')
+            if rows is not None:
+                print(f"Génération : {rows} lignes", flush=True)
+                make_workbook(path, rows, args.error_rate, args.duplicate_rate)
+            print(f"Benchmark : {path}", flush=True)
+            result = run(path, args.repeat, not args.no_memory)
+            result['generated_rows'] = rows
+            runs.append(result)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'error_rate': args.error_rate,
+        'duplicate_rate': args.duplicate_rate,
+        'repeat': args.repeat,
+        # ru_maxrss : kilo-octets sous Linux
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        'runs': runs
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats : {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+
+def compare(before, after):
+    # Rapport avant / après, étape par étape, pour les mêmes tailles
+    previous = {run['generated_rows']: run['stages'] for run in before['runs']}
+    for run in after['runs']:
+        stages = previous.get(run['generated_rows'])
+        if stages is None:
+            continue
+        print(f"{run['generated_rows']} lignes")
+        for name, stage in run['stages'].items():
+            if name in stages and stage['seconds'] > 0:
+                old = stages[name]['seconds']
+                print(f"  {name:<30} {old:8.3f} s -> {stage['seconds']:8.3f} s  (x{old / stage['seconds']:.2f})")
+
+
+if __name__ == '__main__':
+    main()
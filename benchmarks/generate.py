@@ -0,0 +1,108 @@
+import argparse
+import os
+import random
+import sys
+
+from openpyxl import Workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from validation import COLS  # noqa: E402
+
+
+# ----------------------
+# CLASSEUR DE TEST (format ANF)
+# ----------------------
+# Ligne 1 : groupes (Station / 2G / 3G / 4G), ligne 2 : noms des colonnes
+# (les doublons de noms deviennent .1 / .2 à la lecture, comme dans les
+# vrais fichiers), puis une ligne par site. Les valeurs multiples sont
+# séparées par « / », avec des virgules décimales.
+SHEET_NAME = "Trimestriel-Station_BaseQ1 2025"
+
+STATION_COLUMNS = ["Identifiant", "Nom", "Wilaya", "Commune", "Longitude", "Latitude"]
+AZIMUTS = [0, 120, 240, 300]
+
+
+def _header(name):
+    # "Nombre d'antennes MIMO.1" -> "Nombre d'antennes MIMO"
+    base, _, suffix = name.rpartition('.')
+    return base if suffix.isdigit() else name
+
+
+def _columns():
+    groups = ["Station"] * len(STATION_COLUMNS)
+    names = list(STATION_COLUMNS)
+    for gen, fields in COLS.items():
+        for field in fields.values():
+            groups.append(gen)
+            names.append(_header(field))
+    return groups, names
+
+
+def _values(rnd, count, error_rate, make):
+    # count valeurs, une de plus ou de moins avec la probabilité error_rate
+    if rnd.random() < error_rate:
+        count = max(1, count + rnd.choice([-1, 1]))
+    return "/".join(make() for _ in range(count))
+
+
+def _row(rnd, index, lon, lat, error_rate):
+    sectors = rnd.choice([1, 2, 3, 3, 3])
+    azimut = "/".join(str(a) for a in AZIMUTS[:sectors])
+
+    def other_azimut():
+        if rnd.random() < error_rate:
+            return "/".join(str(a + 10) for a in AZIMUTS[:sectors])
+        return azimut
+
+    freq = _values(rnd, sectors, error_rate, lambda: str(rnd.choice([900, 1800])))
+    row = [f"ST{index:06d}", f"Site {index}", "Wilaya", "Commune", lon, lat,
+           freq if rnd.random() > 0.02 else None,
+           _values(rnd, sectors, error_rate, lambda: f"{rnd.randint(0, 10)},5"),
+           _values(rnd, sectors, error_rate, lambda: str(rnd.randint(40, 60))),
+           _values(rnd, sectors, error_rate, lambda: "2"),
+           azimut]
+    for _ in ('3G', '4G'):
+        row += [_values(rnd, sectors, error_rate, lambda: str(rnd.randint(0, 10))),
+                _values(rnd, sectors, error_rate, lambda: str(rnd.randint(40, 60))),
+                _values(rnd, sectors, error_rate, lambda: "4"),
+                other_azimut()]
+    if sectors == 1 and rnd.random() < 0.3:
+        row[7] = 3.5  # cellule numérique plutôt que texte
+    return row
+
+
+def make_workbook(path, rows, error_rate=0.01, duplicate_rate=0.02, seed=0, sheet_name=SHEET_NAME):
+    rnd = random.Random(seed)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    groups, names = _columns()
+    ws.append(groups)
+    ws.append(names)
+
+    coords = []
+    for index in range(rows):
+        if coords and rnd.random() < duplicate_rate:
+            lon, lat = rnd.choice(coords)
+        else:
+            lon, lat = round(rnd.uniform(-2, 8), 5), round(rnd.uniform(19, 37), 5)
+            coords.append((lon, lat))
+        ws.append(_row(rnd, index, lon, lat, error_rate))
+
+    wb.save(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère un classeur de stations pour les benchmarks")
+    parser.add_argument('output')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--duplicate-rate', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    make_workbook(args.output, args.rows, args.error_rate, args.duplicate_rate, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+
+# ----------------------
+# CACHE DES RÉSULTATS (sur disque, partagé entre workers)
+# ----------------------
+# Clé : SHA-256 du fichier envoyé, feuille, action (et rayon), version des
+# contrôles. Chaque entrée est un <clé>.json (résultats) et, s'il y a des
+# lignes signalées, un <clé>.xlsx (classeur coloré). Les écritures passent
+# par un fichier temporaire + os.replace : un autre worker ne lit jamais
+# une entrée incomplète. Éviction par âge puis par taille totale (LRU sur
+# la date de modification, rafraîchie à chaque lecture).
+CACHE_FOLDER = 'cache'
+CACHE_MAX_AGE = 7 * 24 * 60 * 60
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Compteurs propres au worker
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+_lock = threading.Lock()
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def cache_stats():
+    with _lock:
+        return dict(_stats)
+
+
+def upload_digest(session):
+    # Calculé une fois par session
+    if 'sha256' not in session:
+        session['sha256'] = hashlib.sha256(session['data']).hexdigest()
+    return session['sha256']
+
+
+def cache_key(session, sheet_name, action, version, radius=None):
+    parts = [upload_digest(session), sheet_name, action, str(radius or ''), version]
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _paths(key):
+    return os.path.join(CACHE_FOLDER, key + '.json'), os.path.join(CACHE_FOLDER, key + '.xlsx')
+
+
+def cache_lookup(key, result_path):
+    # Résultats en cache (et classeur recopié vers result_path), ou None
+    json_path, xlsx_path = _paths(key)
+    try:
+        with open(json_path, encoding='utf-8') as f:
+            entry = json.load(f)
+        if entry['workbook']:
+            shutil.copyfile(xlsx_path, result_path)
+    except (OSError, ValueError, KeyError):
+        _count('misses')
+        return None
+
+    now = time.time()
+    for path in (json_path, xlsx_path):
+        if os.path.exists(path):
+            os.utime(path, (now, now))
+    _count('hits')
+    return entry['results']
+
+
+def _atomic_write(path, write):
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_FOLDER, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def cache_store(key, results, result_path):
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    json_path, xlsx_path = _paths(key)
+    workbook = bool(result_path) and os.path.exists(result_path)
+    if workbook:
+        # Le classeur d'abord : un .json présent garantit son .xlsx
+        with open(result_path, 'rb') as src:
+            _atomic_write(xlsx_path, lambda f: shutil.copyfileobj(src, f))
+    payload = json.dumps({'results': results, 'workbook': workbook}).encode('utf-8')
+    _atomic_write(json_path, lambda f: f.write(payload))
+    _count('stores')
+    _evict()
+
+
+def _evict():
+    now = time.time()
+    entries = []
+    with os.scandir(CACHE_FOLDER) as it:
+        for entry in it:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # supprimé entre-temps par un autre worker
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, path in entries:
+        if now - mtime <= CACHE_MAX_AGE and total <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            _count('evictions')
+        except OSError:
+            pass
+        total -= size
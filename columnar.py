@@ -0,0 +1,123 @@
+from collections import namedtuple
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+
+# ----------------------
+# COLONNES « RAGGED » : valeurs à plat + offsets
+# ----------------------
+# Une colonne du type "0/120/240" est découpée une seule fois en :
+#   values  : tous les nombres de la colonne, à la suite (float64)
+#   offsets : la ligne i occupe values[offsets[i]:offsets[i + 1]]
+# Une cellule vide ou illisible a une longueur 0.
+#
+# Les mêmes textes reviennent d'un site à l'autre ("0/120/240", "2", ...) :
+# les textes d'une colonne sont d'abord réduits à leurs valeurs distinctes
+# (factorize), chacune n'est convertie qu'une fois, puis le résultat est
+# réparti sur les lignes par code. Les virgules décimales sont acceptées.
+Ragged = namedtuple('Ragged', ['values', 'offsets'])
+
+# Forme codée (encode_ragged) : codes[i] = n° du texte distinct de la ligne
+# i, values / offsets = ces textes découpés (un Ragged d'une entrée par
+# texte, plus une entrée vide pour les cellules manquantes)
+Encoded = namedtuple('Encoded', ['codes', 'values', 'offsets'])
+
+
+def parse_text(text):
+    if text.strip() in ['', 'nan']:
+        return None
+    parts = text.replace(',', '.').split('/')
+    try:
+        # Cas courant : float() accepte déjà les espaces autour des nombres
+        return list(map(float, parts))
+    except ValueError:
+        pass
+    try:
+        return [float(x.strip()) for x in parts if x.strip()]
+    except ValueError:
+        return None
+
+
+def _gather(starts, counts):
+    # Positions à plat des segments [start, start + count) mis bout à bout
+    firsts = np.cumsum(counts) - counts
+    return np.repeat(starts - firsts, counts) + np.arange(counts.sum())
+
+
+def parse_ragged(series):
+    # Même résultat que parse_text cellule par cellule : une cellule vide,
+    # "nan" ou illisible a une longueur 0. Chaque texte distinct de la
+    # colonne n'est découpé qu'une fois, puis réparti sur les lignes.
+    return decode_ragged(encode_ragged(series))
+
+
+def encode_ragged(series):
+    # factorize est plus rapide sur un tableau d'objets que sur le type str
+    codes, uniques = pd.factorize(series.astype(str).to_numpy(dtype=object))
+    parsed = [parse_text(u) or [] for u in uniques.tolist()]
+
+    # Le code -1 (cellule manquante) pointe sur la dernière entrée, vide
+    codes[codes < 0] = len(parsed)
+    lengths = np.array([len(p) for p in parsed] + [0], dtype=np.int64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    values = np.array(list(chain.from_iterable(parsed)), dtype=np.float64)
+    return Encoded(codes.astype(np.int64, copy=False), values, offsets)
+
+
+def decode_ragged(col, start=0, stop=None):
+    # Lignes [start, stop) d'une colonne codée, à plat (Ragged)
+    codes = col.codes[start:stop]
+    starts = col.offsets[codes]
+    lengths = col.offsets[codes + 1] - starts
+    offsets = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return Ragged(col.values[_gather(starts, lengths)], offsets)
+
+
+def parse_numbers(series):
+    # pd.to_numeric(series, errors='coerce'), virgule décimale comprise
+    # ("36,75") : seules les cellules que to_numeric refuse sont reprises,
+    # une fois par texte distinct
+    numbers = pd.to_numeric(series, errors='coerce')
+    if series.dtype.kind in 'iufb':
+        return numbers
+    retry = (numbers.isna() & series.notna()).to_numpy()
+    if retry.any():
+        codes, uniques = pd.factorize(series[retry])
+        texts = [u.replace(',', '.') if isinstance(u, str) and ',' in u else None for u in uniques.tolist()]
+        fixed = pd.to_numeric(pd.Series(texts, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+        numbers = numbers.astype(np.float64)
+        numbers[retry] = fixed[codes]
+    return numbers
+
+
+def ragged_lengths(col):
+    return np.diff(col.offsets)
+
+
+def count_mismatch(lengths, ref_lengths, active):
+    # Nombre de valeurs différent de la référence (cellules non vides)
+    return active & (lengths > 0) & (lengths != ref_lengths)
+
+
+def values_mismatch(col, ref, active):
+    # Listes différentes : longueur différente ou au moins un élément différent
+    lengths = ragged_lengths(col)
+    ref_lengths = ragged_lengths(ref)
+    both = active & (lengths > 0) & (ref_lengths > 0)
+    mismatch = both & (lengths != ref_lengths)
+
+    rows = np.flatnonzero(both & (lengths == ref_lengths))
+    if rows.size:
+        counts = lengths[rows]
+        firsts = np.cumsum(counts) - counts
+        left = col.values[_gather(col.offsets[rows], counts)]
+        right = ref.values[_gather(ref.offsets[rows], counts)]
+        # NaN != NaN, comme la comparaison de listes Python
+        differs = np.add.reduceat((left != right).astype(np.int64), firsts) > 0
+        mismatch[rows] = differs
+
+    return mismatch
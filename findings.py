@@ -0,0 +1,187 @@
+import math
+import threading
+from collections import Counter
+
+from rules import COLUMNS
+
+
+# ----------------------
+# LECTURE PAGINÉE DES RÉSULTATS (/results/<id>)
+# ----------------------
+# Les lignes trouvées restent dans le traitement (jobs.py) : le navigateur
+# n'en demande qu'une page à la fois, filtrée (génération, champ, colonne,
+# feuille, plage de lignes) et triée. Chaque vue (filtres + tri) est
+# calculée une fois : positions des lignes retenues, gardées avec le
+# traitement (MAX_VIEWS dernières) ; les pages suivantes ne font que la
+# découper. Le curseur est la position dans la vue : les résultats d'un
+# traitement terminé ne changent plus.
+KINDS = ('errors', 'doublons', 'registre')
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_VIEWS = 8  # par traitement
+
+# Colonne de la feuille -> (génération, champ), d'après rules.yaml
+COLUMN_FIELDS = {name: (gen, field) for gen, fields in COLUMNS.items() for field, name in fields.items()}
+
+_lock = threading.Lock()
+
+
+def _values(args, name):
+    # name=a,b ou name=a&name=b
+    return [value.strip() for arg in args.getlist(name) for value in arg.split(',') if value.strip()]
+
+
+def _integer(args, name, default, low, message):
+    value = args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(message)
+    if value < low:
+        raise ValueError(message)
+    return value
+
+
+def parse_query(args):
+    # Paramètres de /results/<id> -> (type, filtres, tri, curseur, taille)
+    kind = args.get('kind')
+    if kind is not None and kind not in KINDS:
+        raise ValueError('Type de résultat inconnu')
+
+    filters = {}
+    columns = None  # colonnes retenues par génération / champ / colonne
+    generations = _values(args, 'generation')
+    if generations:
+        unknown = [gen for gen in generations if gen not in COLUMNS]
+        if unknown:
+            raise ValueError('Générations inconnues : ' + ', '.join(unknown))
+        columns = {name for name, (gen, _) in COLUMN_FIELDS.items() if gen in generations}
+    fields = _values(args, 'field')
+    if fields:
+        unknown = [field for field in fields if not any(field == f for _, f in COLUMN_FIELDS.values())]
+        if unknown:
+            raise ValueError('Champs inconnus : ' + ', '.join(unknown))
+        wanted = {name for name, (_, field) in COLUMN_FIELDS.items() if field in fields}
+        columns = wanted if columns is None else columns & wanted
+    # Noms de colonnes : virgules possibles, une valeur par paramètre
+    names = [name for name in args.getlist('column') if name]
+    if names:
+        columns = set(names) if columns is None else columns & set(names)
+    if columns is not None:
+        filters['columns'] = frozenset(columns)
+    sheets = [name for name in args.getlist('sheet') if name]
+    if sheets:
+        filters['sheets'] = frozenset(sheets)
+    row_min = _integer(args, 'row_min', None, 0, 'Plage de lignes invalide')
+    row_max = _integer(args, 'row_max', None, 0, 'Plage de lignes invalide')
+    if row_min is not None or row_max is not None:
+        filters['rows'] = (row_min, row_max)
+
+    sort = args.get('sort') or None
+    cursor = _integer(args, 'cursor', 0, 0, 'Curseur invalide')
+    limit = _integer(args, 'limit', PAGE_SIZE, 1, 'Taille de page invalide')
+    return kind, filters, sort, cursor, min(limit, MAX_PAGE_SIZE)
+
+
+def _kept(line, filters):
+    if 'columns' in filters and line.get('Colonne') not in filters['columns']:
+        return False
+    if 'sheets' in filters and line.get('Feuille') not in filters['sheets']:
+        return False
+    if 'rows' in filters:
+        row_min, row_max = filters['rows']
+        if (row_min is not None and line['Ligne'] < row_min) or (row_max is not None and line['Ligne'] > row_max):
+            return False
+    return True
+
+
+def _sort_key(value):
+    # Nombres, puis textes ; cellules vides à la fin dans les deux sens
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, (int, float)):
+        return 0, value
+    return 1, str(value)
+
+
+def _view(job, kind, filters, sort):
+    # Positions des lignes retenues, dans l'ordre demandé
+    key = (kind, tuple(sorted(filters.items())), sort)
+    with _lock:
+        views = job['views']
+        if key in views:
+            views.move_to_end(key)
+            return views[key]
+
+    lines = job['result']['results'][kind]
+    order = [i for i, line in enumerate(lines) if _kept(line, filters)]
+    if sort:
+        name = sort.lstrip('-')
+        if lines and not any(name in line for line in lines):
+            raise ValueError(f"Tri impossible : « {name} »")
+        keys = {i: _sort_key(lines[i].get(name)) for i in order}
+        filled = sorted((i for i in order if keys[i] is not None), key=keys.get, reverse=sort.startswith('-'))
+        order = filled + [i for i in order if keys[i] is None]
+
+    with _lock:
+        views[key] = order
+        while len(views) > MAX_VIEWS:
+            views.popitem(last=False)
+    return order
+
+
+def _summary(kind, lines):
+    info = {'total': len(lines)}
+    if lines and 'Feuille' in lines[0]:
+        info['sheets'] = dict(Counter(line['Feuille'] for line in lines))
+    if kind == 'errors':
+        columns = Counter(line['Colonne'] for line in lines)
+        generations = Counter()
+        for name, count in columns.items():
+            if name in COLUMN_FIELDS:
+                generations[COLUMN_FIELDS[name][0]] += count
+        info['generations'] = dict(generations)
+        info['columns'] = dict(columns)
+    elif kind == 'doublons':
+        info['rules'] = dict(Counter(line['Règle'] for line in lines))
+        info['groups'] = len({(line.get('Feuille'), line['Groupe']) for line in lines})
+    return info
+
+
+def result_summary(job):
+    # Nombres par type de résultat (génération, colonne, règle, feuille)
+    key = ('summary',)
+    with _lock:
+        if key in job['views']:
+            return job['views'][key]
+    results = job['result']['results']
+    summary = {kind: _summary(kind, results[kind]) for kind in KINDS if isinstance(results.get(kind), list)}
+    with _lock:
+        job['views'][key] = summary
+    return summary
+
+
+def query_results(job, kind, filters, sort, cursor, limit):
+    # Une page de lignes ; next : curseur de la page suivante (None à la fin)
+    results = job['result']['results']
+    present = [name for name in KINDS if isinstance(results.get(name), list)]
+    if kind is None:
+        if not present:
+            raise ValueError('Aucune ligne dans ce résultat')
+        kind = present[0]
+    elif kind not in present:
+        raise ValueError('Type de résultat absent de ce traitement')
+
+    lines = results[kind]
+    order = _view(job, kind, filters, sort)
+    end = cursor + limit
+    return {
+        'kind': kind,
+        'total': len(lines),
+        'matched': len(order),
+        'lines': [lines[i] for i in order[cursor:end]],
+        'next': str(end) if end < len(order) else None,
+        'summary': result_summary(job)[kind]
+    }
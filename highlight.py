@@ -0,0 +1,315 @@
+import copy
+import math
+import posixpath
+import re
+import shutil
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
+
+
+# ----------------------
+# COLORATION DIRECTEMENT DANS LE ZIP .xlsx
+# ----------------------
+# Le classeur n'est pas rechargé par openpyxl : seules les feuilles concernées
+# et xl/styles.xml sont réécrites, au fil de l'eau. Une entrée <fill> est
+# ajoutée par couleur, ainsi qu'une copie colorée de chaque style (cellXfs)
+# utilisé par les lignes signalées ; les attributs s= de ces lignes sont
+# remplacés. Des feuilles de rapport peuvent être ajoutées à la fin du
+# classeur. Les autres fichiers du zip sont recopiés à l'identique.
+
+NS_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+NS_PKG_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+CHUNK_SIZE = 1 << 20
+
+WORKSHEET_RE = re.compile(rb'<(\w+:)?worksheet\b')
+ROW_START_RE = re.compile(rb'<(?:\w+:)?row\b[^>]*?/?>')
+CELL_START_RE = re.compile(rb'<(?:\w+:)?c\b[^>]*?/?>')
+ROW_NUM_RE = re.compile(rb'\sr="(\d+)"')
+STYLE_RE = re.compile(rb'\ss="(\d+)"')
+FILLS_RE = re.compile(rb'<((?:\w+:)?)fills\b[^>]*>(.*?)</(?:\w+:)?fills>', re.S)
+FILL_RE = re.compile(rb'<(?:\w+:)?fill\b')
+CELL_XFS_RE = re.compile(rb'<((?:\w+:)?)cellXfs\b[^>]*>(.*?)</(?:\w+:)?cellXfs>', re.S)
+XF_RE = re.compile(rb'<(?:\w+:)?xf\b[^>]*?(?:/>|>.*?</(?:\w+:)?xf>)', re.S)
+
+
+def _set_attr(tag, name, value):
+    # Remplace (ou ajoute) l'attribut name="value" d'une balise ouvrante
+    pattern = re.compile(rb'\s' + name + rb'="[^"]*"')
+    attr = b' ' + name + b'="' + value + b'"'
+    if pattern.search(tag):
+        return pattern.sub(attr, tag, count=1)
+    end = -2 if tag.endswith(b'/>') else -1
+    return tag[:end] + attr + tag[end:]
+
+
+def _set_count(tag, count):
+    return _set_attr(tag, b'count', str(count).encode())
+
+
+def sheet_paths(zin):
+    # Nom de feuille -> chemin de son XML dans le zip
+    workbook = ET.fromstring(zin.read('xl/workbook.xml'))
+    rels = ET.fromstring(zin.read('xl/_rels/workbook.xml.rels'))
+    targets = {}
+    for rel in rels.iter(NS_PKG_REL + 'Relationship'):
+        target = rel.get('Target')
+        if target.startswith('/'):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join('xl', target))
+        targets[rel.get('Id')] = target
+
+    return {sheet.get('name'): targets[sheet.get(NS_REL + 'id')]
+            for sheet in workbook.iter(NS_MAIN + 'sheet')}
+
+
+class _Styles:
+    # styles.xml est petit : il est modifié en mémoire, une fois la feuille
+    # parcourue (seuls les styles réellement utilisés sont copiés)
+    def __init__(self, xml, colors):
+        self.xml = xml
+        fills = FILLS_RE.search(xml)
+        xfs = CELL_XFS_RE.search(xml)
+        if not fills or not xfs:
+            raise ValueError('styles.xml sans <fills> ou <cellXfs>')
+        self.fill_id = len(FILL_RE.findall(fills.group(2)))
+        self.fill_prefix = fills.group(1)
+        self.xfs = XF_RE.findall(xfs.group(2))
+        self.colors = list(colors)
+        self.mapping = {}
+
+    def colored(self, index, color):
+        # Index du style « index + remplissage », créé à la première demande
+        if index >= len(self.xfs):
+            index = 0
+        if (index, color) not in self.mapping:
+            self.mapping[(index, color)] = len(self.xfs) + len(self.mapping)
+        return self.mapping[(index, color)]
+
+    def render(self):
+        p = self.fill_prefix
+        fills_xml = b''
+        for color in self.colors:
+            rgb = b'00' + color.encode()
+            fills_xml += (b'<' + p + b'fill><' + p + b'patternFill patternType="solid"><'
+                          + p + b'fgColor rgb="' + rgb + b'"/><' + p + b'bgColor rgb="' + rgb + b'"/></'
+                          + p + b'patternFill></' + p + b'fill>')
+
+        clones = []
+        for (index, color), _ in sorted(self.mapping.items(), key=lambda item: item[1]):
+            xf = self.xfs[index]
+            start = re.match(rb'<[^>]*?/?>', xf).group(0)
+            fill_id = self.fill_id + self.colors.index(color)
+            tag = _set_attr(_set_attr(start, b'fillId', str(fill_id).encode()), b'applyFill', b'1')
+            clones.append(tag + xf[len(start):])
+
+        xml = self.xml
+        fills = FILLS_RE.search(xml)
+        head = _set_count(xml[fills.start():fills.start(2)], self.fill_id + len(self.colors))
+        xml = xml[:fills.start()] + head + fills.group(2) + fills_xml + xml[fills.end(2):]
+
+        xfs = CELL_XFS_RE.search(xml)
+        head = _set_count(xml[xfs.start():xfs.start(2)], len(self.xfs) + len(clones))
+        return xml[:xfs.start()] + head + xfs.group(2) + b''.join(clones) + xml[xfs.end(2):]
+
+
+def _restyle_row(row_xml, styles, color):
+    start = ROW_START_RE.match(row_xml).group(0)
+    style = STYLE_RE.search(start)
+    new_start = _set_attr(start, b's', str(styles.colored(int(style.group(1)) if style else 0, color)).encode())
+    new_start = _set_attr(new_start, b'customFormat', b'1')
+
+    def restyle_cell(match):
+        tag = match.group(0)
+        style = STYLE_RE.search(tag)
+        return _set_attr(tag, b's', str(styles.colored(int(style.group(1)) if style else 0, color)).encode())
+
+    return new_start + CELL_START_RE.sub(restyle_cell, row_xml[len(start):])
+
+
+def _row_patterns(buffer):
+    # Préfixe d'espace de noms éventuel (<x:row>), lu sur la racine : avec
+    # un préfixe littéral, la recherche des balises <row> est bien plus rapide
+    root = WORKSHEET_RE.search(buffer)
+    prefix = root.group(1) or b'' if root else b''
+    return re.compile(b'<' + re.escape(prefix) + rb'row\b[^>]*>'), b'</' + prefix + b'row>'
+
+
+def _rewrite_sheet(src, dst, rows, styles):
+    # rows : n° de ligne -> couleur
+    buffer = b''
+    row_start = row_end = None
+    current = 0  # une ligne sans r= suit la précédente
+    while True:
+        data = src.read(CHUNK_SIZE)
+        buffer += data
+        if row_start is None:
+            row_start, row_end = _row_patterns(buffer)
+
+        # Au-delà du dernier « < », une balise peut être coupée
+        safe = buffer.rfind(b'<') if data else len(buffer)
+        done = 0
+        for match in row_start.finditer(buffer, 0, safe):
+            tag = match.group(0)
+            num = ROW_NUM_RE.search(tag)
+            row_num = int(num.group(1)) if num else current + 1
+            if row_num in rows:
+                if tag.endswith(b'/>'):
+                    end = match.end()
+                else:
+                    end = buffer.find(row_end, match.end())
+                    if end == -1:
+                        # Ligne incomplète : reprise au bloc suivant
+                        safe = match.start()
+                        break
+                    end += len(row_end)
+                dst.write(buffer[done:match.start()])
+                dst.write(_restyle_row(buffer[match.start():end], styles, rows[row_num]))
+                done = end
+            current = row_num
+
+        if not data:
+            dst.write(buffer[done:])
+            return
+        if safe > done:
+            dst.write(buffer[done:safe])
+        buffer = buffer[max(done, safe):]
+
+
+# ----------------------
+# FEUILLES DE RAPPORT
+# ----------------------
+# Une feuille par rapport (titre, colonnes, lignes), écrite en chaînes
+# « inline » : sharedStrings.xml n'est pas modifié. workbook.xml, ses
+# relations et [Content_Types].xml reçoivent chacun une entrée de plus.
+WORKSHEET_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet'
+WORKSHEET_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml'
+NS_REL_URI = NS_REL[1:-1]
+
+SHEETS_END_RE = re.compile(rb'</((?:\w+:)?)sheets>')
+SHEET_ID_RE = re.compile(rb'<(?:\w+:)?sheet\b[^>]*?\ssheetId="(\d+)"')
+REL_PREFIX_RE = re.compile(rb'xmlns:(\w+)="' + re.escape(NS_REL_URI.encode()) + rb'"')
+REL_ID_RE = re.compile(rb'\sId="([^"]+)"')
+RELATIONSHIPS_END_RE = re.compile(rb'</((?:\w+:)?)Relationships>')
+TYPES_END_RE = re.compile(rb'</((?:\w+:)?)Types>')
+CONTENT_TYPES_PATH = '[Content_Types].xml'
+
+
+def _column_letter(number):
+    letters = ''
+    while number:
+        number, rest = divmod(number - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+
+def _report_cell(ref, value):
+    if value is None or (isinstance(value, float) and not math.isfinite(value)):
+        return ''
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"><v>{value!r}</v></c>'
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+
+def _report_sheet(columns, lines):
+    letters = [_column_letter(i + 1) for i in range(len(columns))]
+    rows = [columns] + [[line.get(name) for name in columns] for line in lines]
+    parts = [f'<worksheet xmlns="{NS_MAIN[1:-1]}"><sheetData>']
+    for number, values in enumerate(rows, 1):
+        cells = ''.join(_report_cell(f'{letter}{number}', value) for letter, value in zip(letters, values))
+        parts.append(f'<row r="{number}">{cells}</row>')
+    parts.append('</sheetData></worksheet>')
+    return ''.join(parts).encode('utf-8')
+
+
+def _add_reports(zin, reports):
+    # Parties modifiées ou ajoutées : chemin -> contenu
+    names = set(sheet_paths(zin))
+    files = set(zin.namelist())
+    workbook = zin.read('xl/workbook.xml')
+    rels = zin.read('xl/_rels/workbook.xml.rels')
+    types = zin.read(CONTENT_TYPES_PATH)
+
+    prefix = REL_PREFIX_RE.search(workbook)
+    rel_attr = prefix.group(1).decode() + ':id' if prefix else f'xmlns:hwr="{NS_REL_URI}" hwr:id'
+    sheet_id = max((int(x) for x in SHEET_ID_RE.findall(workbook)), default=0)
+    rel_ids = {x.decode() for x in REL_ID_RE.findall(rels)}
+
+    parts = {}
+    new_sheets = new_rels = new_types = ''
+    for title, columns, lines in reports:
+        name, k = title, 1
+        while name in names:
+            k += 1
+            name = f'{title} ({k})'
+        names.add(name)
+
+        k = 1
+        while f'xl/worksheets/rapport{k}.xml' in files or f'rIdRapport{k}' in rel_ids:
+            k += 1
+        path = f'xl/worksheets/rapport{k}.xml'
+        rel_id = f'rIdRapport{k}'
+        files.add(path)
+        rel_ids.add(rel_id)
+        sheet_id += 1
+
+        parts[path] = _report_sheet(columns, lines)
+        new_sheets += f'<sheet name={quoteattr(name)} sheetId="{sheet_id}" {rel_attr}="{rel_id}"/>'
+        new_rels += f'<Relationship Id="{rel_id}" Type="{WORKSHEET_TYPE}" Target="/{path}"/>'
+        new_types += f'<Override PartName="/{path}" ContentType="{WORKSHEET_CONTENT_TYPE}"/>'
+
+    def insert(xml, end_re, fragment):
+        end = end_re.search(xml)
+        if end is None:
+            raise ValueError('Partie du classeur inattendue')
+        # Même préfixe d'espace de noms que l'élément parent
+        fragment = re.sub(r'<(?=\w)', '<' + end.group(1).decode(), fragment)
+        return xml[:end.start()] + fragment.encode('utf-8') + xml[end.start():]
+
+    parts['xl/workbook.xml'] = insert(workbook, SHEETS_END_RE, new_sheets)
+    parts['xl/_rels/workbook.xml.rels'] = insert(rels, RELATIONSHIPS_END_RE, new_rels)
+    parts[CONTENT_TYPES_PATH] = insert(types, TYPES_END_RE, new_types)
+    return parts
+
+
+def highlight_rows(input_path, output_path, sheets, reports=()):
+    # sheets : nom de feuille -> [(n° de lignes, couleur)] ; une ligne
+    # signalée deux fois garde la première couleur
+    colors = []
+    for highlights in sheets.values():
+        colors += [color for _, color in highlights if color not in colors]
+    with zipfile.ZipFile(input_path) as zin:
+        paths = sheet_paths(zin)
+        rows = {}
+        for sheet_name, highlights in sheets.items():
+            sheet_rows = rows[paths[sheet_name]] = {}
+            for row_numbers, color in reversed(highlights):
+                sheet_rows.update(dict.fromkeys(row_numbers, color))
+        styles_path = 'xl/styles.xml'
+        styles = _Styles(zin.read(styles_path), colors)
+        parts = _add_reports(zin, reports) if reports else {}
+
+        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                if info.filename == styles_path:
+                    continue
+                if info.filename in parts:
+                    zout.writestr(copy.copy(info), parts.pop(info.filename))
+                    continue
+                with zin.open(info) as src, zout.open(copy.copy(info), 'w') as dst:
+                    if info.filename in rows:
+                        _rewrite_sheet(src, dst, rows[info.filename], styles)
+                    else:
+                        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+            # Nouvelles feuilles de rapport
+            for path, xml in parts.items():
+                zout.writestr(path, xml, zipfile.ZIP_DEFLATED)
+
+            # styles.xml en dernier : les styles à copier sont alors connus
+            zout.writestr(copy.copy(zin.getinfo(styles_path)), styles.render())
@@ -0,0 +1,168 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from rules import rule_fields, rules_version, evaluate_rules
+from validation import ENGINE_VERSION, error_hits, error_lines
+
+
+# ----------------------
+# REVALIDATION INCRÉMENTALE (empreintes de lignes)
+# ----------------------
+# D'un trimestre à l'autre, la plupart des lignes ne changent pas. Chaque
+# ligne reçoit une clé (Identifiant, et son rang s'il apparaît plusieurs
+# fois) et une empreinte de ses colonnes contrôlées ; le dernier passage
+# est gardé dans une base SQLite locale : clé -> (empreinte, erreurs).
+# Seules les lignes nouvelles ou modifiées sont recontrôlées, les erreurs
+# des autres sont reprises telles quelles. Une base = un enregistrement :
+# clés et empreintes en tableaux binaires, erreurs en un seul document
+# JSON (lignes en erreur seulement) ; les clés des classeurs absents de ce
+# passage y restent, plusieurs classeurs peuvent partager la base.
+#
+# Les erreurs d'une ligne ne dépendent que du texte de ses colonnes
+# contrôlées (columnar.parse_ragged travaille sur astype(str)) : c'est ce
+# texte qui est haché, et une ligne reprise donne exactement le même
+# résultat qu'un nouveau contrôle. La clé ne sert qu'à retrouver la ligne
+# du passage précédent. Une base par version des contrôles et jeu de
+# règles ; celles qui ne servent plus sont supprimées après HISTORY_MAX_AGE.
+HISTORY_PATH = os.environ.get('HISTORY_PATH', 'history.sqlite3')
+HISTORY_MAX_AGE = 400 * 24 * 60 * 60  # un peu plus d'un an de trimestres
+
+
+def _connect():
+    # Transactions explicites (_transaction)
+    db = sqlite3.connect(HISTORY_PATH, timeout=30, isolation_level=None)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('CREATE TABLE IF NOT EXISTS snapshots (store TEXT PRIMARY KEY, keys BLOB, hashes BLOB,'
+               ' findings TEXT, last_used REAL)')
+    return db
+
+
+@contextmanager
+def _transaction(db, mode='DEFERRED'):
+    db.execute('BEGIN ' + mode)
+    try:
+        yield
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    db.execute('COMMIT')
+
+
+def _hash(frame):
+    # Une empreinte 64 bits par ligne (entier signé, comme SQLite)
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy().view(np.int64)
+
+
+def row_keys(df):
+    # Identifiant et rang parmi les lignes de même Identifiant ; à défaut
+    # de colonne Identifiant, la position
+    if 'Identifiant' not in df.columns:
+        return np.arange(len(df), dtype=np.int64)
+    ids = df['Identifiant'].astype(str).reset_index(drop=True)
+    rank = ids.groupby(ids, sort=False).cumcount()
+    return _hash(pd.DataFrame({'id': ids, 'rank': rank}))
+
+
+def row_hashes(df, fields):
+    return _hash(df[fields].astype(str))
+
+
+def _load(db, store):
+    # (clés, empreintes, {clé: [[règle, message], ...]}) du dernier passage
+    row = db.execute('SELECT keys, hashes, findings FROM snapshots WHERE store = ?', (store,)).fetchone()
+    if row is None:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), {}
+    return (np.frombuffer(row[0], dtype=np.int64), np.frombuffer(row[1], dtype=np.int64),
+            {key: findings for key, findings in json.loads(row[2])})
+
+
+def _save(db, store, keys, hashes, findings):
+    now = time.time()
+    if keys is None:
+        db.execute('UPDATE snapshots SET last_used = ? WHERE store = ?', (now, store))
+    else:
+        db.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?)',
+                   (store, keys.tobytes(), hashes.tobytes(), json.dumps(list(findings.items())), now))
+    db.execute('DELETE FROM snapshots WHERE last_used < ?', (now - HISTORY_MAX_AGE,))
+
+
+def _revalidate(df, rules, timings, keys, hashes, previous):
+    # Lignes nouvelles ou modifiées contrôlées, erreurs des autres reprises
+    # du passage précédent : (rows, order, messages, lignes reprises,
+    # passage à enregistrer)
+    previous_keys, previous_hashes, previous_findings = previous
+    where = pd.Index(previous_keys).get_indexer(keys) if len(previous_keys) else np.full(len(df), -1)
+    known = where >= 0
+    reused = known.copy()
+    reused[known] = previous_hashes[where[known]] == hashes[known]
+    changed = np.flatnonzero(~reused)
+
+    # Lignes nouvelles ou modifiées : contrôlées
+    rows, order, messages = error_hits(evaluate_rules(df.iloc[changed], rules, timings))
+    rows = changed[rows]
+
+    # Lignes reprises : erreurs du passage précédent (seules les lignes
+    # en erreur sont cherchées dans le document)
+    number = {rule['id']: k for k, rule in enumerate(rules)}
+    old_rows, old_order, old_messages = [], [], []
+    same = np.flatnonzero(reused)
+    if previous_findings and same.size:
+        found_keys = np.fromiter(previous_findings, dtype=np.int64, count=len(previous_findings))
+        hit = pd.Index(found_keys).get_indexer(keys[same]) >= 0
+        for pos in same[hit].tolist():
+            for rule_id, message in previous_findings[int(keys[pos])]:
+                old_rows.append(pos)
+                old_order.append(number[rule_id])
+                old_messages.append(message)
+
+    # Nouveau passage : clés anciennes absentes de la feuille, puis celles
+    # de la feuille (une clé en double n'est gardée qu'une fois)
+    if changed.size:
+        findings = previous_findings
+        for key in keys[changed].tolist():
+            findings.pop(key, None)
+        for pos, k, message in zip(rows.tolist(), order.tolist(), messages):
+            findings.setdefault(int(keys[pos]), []).append([rules[k]['id'], message])
+        kept = ~np.isin(previous_keys, keys)
+        new_keys, first = np.unique(np.concatenate([keys, previous_keys[kept]]), return_index=True)
+        new_hashes = np.concatenate([hashes, previous_hashes[kept]])[first]
+    else:
+        new_keys = new_hashes = findings = None
+
+    rows = np.concatenate([rows, np.array(old_rows, dtype=np.int64)])
+    order = np.concatenate([order, np.array(old_order, dtype=np.int64)])
+    return rows, order, messages + old_messages, int(reused.sum()), (new_keys, new_hashes, findings)
+
+
+def find_errors_incremental(df, first_row, rules, timings=None, stats=None):
+    # Même résultat que validation.find_errors ; stats reçoit le nombre de
+    # lignes reprises (reused) et recontrôlées (recomputed)
+    store = ENGINE_VERSION + '-' + rules_version(rules)
+    keys = row_keys(df)
+    hashes = row_hashes(df, rule_fields(rules))
+
+    # Lecture, contrôle et enregistrement dans une même transaction : deux
+    # traitements sur la même base (threads ou processus) ne partent pas
+    # du même passage, le second voit les lignes du premier
+    db = _connect()
+    try:
+        with _transaction(db, 'IMMEDIATE'):
+            rows, order, messages, reused, snapshot = _revalidate(df, rules, timings, keys, hashes,
+                                                                  _load(db, store))
+            _save(db, store, *snapshot)
+    finally:
+        db.close()
+
+    if stats is not None:
+        stats['reused'] = reused
+        stats['recomputed'] = len(df) - reused
+
+    # Dans l'ordre où une ligne est contrôlée : ligne, puis règle
+    sort = np.lexsort((order, rows))
+    return error_lines(df, first_row, rules, rows[sort], order[sort], [messages[i] for i in sort.tolist()])
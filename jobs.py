@@ -0,0 +1,195 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+# ----------------------
+# FILE DE TRAITEMENTS
+# ----------------------
+# /process ne fait plus l'analyse dans la requête : le traitement est confié
+# à un pool local et /jobs/<id> en donne l'état. Les traitements terminés
+# sont gardés un temps limité (JOB_TTL) et en nombre limité (MAX_JOBS).
+JOB_WORKERS = 2
+JOB_TTL = 60 * 60
+MAX_JOBS = 200
+
+PENDING = 'en_attente'
+RUNNING = 'en_cours'
+DONE = 'termine'
+FAILED = 'echec'
+
+_jobs = OrderedDict()
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+
+# ----------------------
+# AVANCEMENT (/jobs/<id>/events)
+# ----------------------
+# Le traitement publie son avancement dans job['progress'] : étape en
+# cours (chaque metrics.stage du thread), lignes contrôlées sur le total,
+# nombres trouvés et les premières erreurs (aperçu). Chaque changement
+# incrémente job['version'] et réveille les flux d'événements qui
+# attendent. Hors d'un traitement (appel direct, processus du pool),
+# progress() et found() ne font rien.
+PREVIEW_LINES = 20
+
+_changed = threading.Condition()
+_current = threading.local()
+
+
+def _add_job(**values):
+    job = {
+        'id': uuid.uuid4().hex,
+        'state': PENDING,
+        'created': time.time(),
+        'started': None,
+        'finished': None,
+        'result': None,
+        'error': None,
+        'timings': None,
+        'progress': {'stage': None, 'rows': 0, 'rows_total': None, 'errors': 0, 'doublons': 0, 'preview': []},
+        'version': 0,
+        'views': OrderedDict()  # lectures paginées (/results/<id>, findings.py)
+    }
+    job.update(values)
+    with _lock:
+        _jobs[job['id']] = job
+        _evict()
+    return job
+
+
+def submit_job(func, *args):
+    job = _add_job()
+    _executor.submit(_run, job, func, args)
+    return job['id']
+
+
+def done_job(result):
+    # Résultat déjà connu (cache) : traitement terminé d'emblée, lisible
+    # comme les autres sur /jobs/<id> et /results/<id>
+    now = time.time()
+    return _add_job(state=DONE, started=now, finished=now, result=result)['id']
+
+
+def _run(job, func, args):
+    job['started'] = time.time()
+    job['state'] = RUNNING
+    metrics.observe('queue', '', job['started'] - job['created'])
+    if metrics.ENABLED:
+        metrics.begin_timings()
+    _current.job = job
+    _current.commits = []
+    metrics.on_stage(lambda name: progress(stage=name))
+    try:
+        result = func(*args)
+        # Écritures différées jusqu'à la réussite du traitement (on_success)
+        for callback in _current.commits:
+            callback()
+        job['result'] = result
+        job['state'] = DONE
+    except Exception as e:
+        job['error'] = str(e)
+        job['state'] = FAILED
+    finally:
+        metrics.on_stage(None)
+        _current.job = _current.commits = None
+        if metrics.ENABLED:
+            job['timings'] = metrics.end_timings()
+        with _changed:
+            job['finished'] = time.time()
+            job['version'] += 1
+            _changed.notify_all()
+
+
+def on_success(callback):
+    # callback() une fois le traitement en cours terminé sans erreur (une
+    # erreur de callback le fait échouer) ; hors traitement : tout de suite
+    commits = getattr(_current, 'commits', None)
+    if commits is None:
+        callback()
+    else:
+        commits.append(callback)
+
+
+def progress(stage=None, **values):
+    # Étape et valeurs (rows, rows_total...) du traitement en cours
+    job = getattr(_current, 'job', None)
+    if job is None:
+        return
+    with _changed:
+        if stage is not None:
+            job['progress']['stage'] = stage
+        job['progress'].update(values)
+        job['version'] += 1
+        _changed.notify_all()
+
+
+def found(kind, lines):
+    # kind : 'errors' ou 'doublons' ; les premières erreurs vont dans
+    # l'aperçu
+    job = getattr(_current, 'job', None)
+    if job is None or not lines:
+        return
+    with _changed:
+        info = job['progress']
+        info[kind] += len(lines)
+        room = PREVIEW_LINES - len(info['preview'])
+        if kind == 'errors' and room > 0:
+            info['preview'] += [dict(line) for line in lines[:room]]
+        job['version'] += 1
+        _changed.notify_all()
+
+
+def wait_progress(job, version, timeout):
+    # Attend un changement après version (au plus timeout secondes) ; rend
+    # la version courante
+    with _changed:
+        _changed.wait_for(lambda: job['version'] != version, timeout)
+        return job['version']
+
+
+def job_progress(job):
+    # Événement « progress » : état et copie de l'avancement
+    with _changed:
+        info = dict(job['progress'], preview=list(job['progress']['preview']))
+    return {'job': job['id'], 'state': job['state'], 'progress': info}
+
+
+def get_job(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def _evict():
+    # Seuls les traitements terminés (ou en échec) sont oubliés
+    now = time.time()
+    finished = [job_id for job_id, job in _jobs.items() if job['finished'] is not None]
+    for job_id in finished:
+        if now - _jobs[job_id]['finished'] > JOB_TTL:
+            del _jobs[job_id]
+    for job_id in finished:
+        if len(_jobs) <= MAX_JOBS:
+            break
+        _jobs.pop(job_id, None)
+
+
+def job_status(job):
+    # Réponse de /jobs/<id> : état, durées (secondes) et résultat éventuel
+    started, finished = job['started'], job['finished']
+    status = {
+        'job': job['id'],
+        'state': job['state'],
+        'timing': {
+            'queued': round((started or time.time()) - job['created'], 3),
+            'running': round((finished or time.time()) - started, 3) if started else None
+        }
+    }
+    if job['state'] == DONE:
+        status.update(job['result'])
+    elif job['state'] == FAILED:
+        status['error'] = job['error']
+    return status
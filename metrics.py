@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# ----------------------
+# MESURES (Server-Timing et /metrics)
+# ----------------------
+# stage() chronomètre une étape : la durée alimente un histogramme par
+# (étape, action) et, si un enregistrement est en cours dans le thread
+# (begin_timings), la liste renvoyée au client dans l'en-tête
+# Server-Timing. METRICS=0 désactive tout : stage() ne fait alors qu'un
+# test de booléen (et l'appel de on_stage, s'il y en a un : avancement des
+# traitements, jobs.py). Les valeurs sont propres au worker.
+ENABLED = os.environ.get('METRICS', '1') != '0'
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_histograms = {}  # (étape, action) -> [compte par seau, somme, total]
+_counters = {}    # (nom, action) -> valeur
+_lock = threading.Lock()
+_current = threading.local()
+
+
+def begin_timings():
+    _current.timings = []
+    return _current.timings
+
+
+def end_timings():
+    timings = getattr(_current, 'timings', None)
+    _current.timings = None
+    return timings
+
+
+def observe(name, action, seconds):
+    if not ENABLED:
+        return
+    with _lock:
+        histogram = _histograms.get((name, action))
+        if histogram is None:
+            histogram = _histograms[(name, action)] = [[0] * len(BUCKETS), 0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[0][i] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+
+def record(name, seconds, action=''):
+    # Durée d'une étape mesurée ailleurs (par ex. une règle, cumulée sur
+    # tous les blocs d'une lecture par blocs)
+    if not ENABLED:
+        return
+    observe(name, action, seconds)
+    timings = getattr(_current, 'timings', None)
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+def on_stage(callback):
+    # callback(étape) au début de chaque étape du thread ; None : plus rien
+    _current.on_stage = callback
+
+
+@contextmanager
+def stage(name, action=''):
+    callback = getattr(_current, 'on_stage', None)
+    if callback is not None:
+        callback(name)
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, action)
+
+
+def inc(name, value, action=''):
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[(name, action)] = _counters.get((name, action), 0) + value
+
+
+def server_timing(timings):
+    # "read;dur=812.3, validate;dur=20.1" (millisecondes)
+    return ', '.join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings or [])
+
+
+def _labels(**labels):
+    pairs = [f'{key}="{value}"' for key, value in labels.items() if value != '']
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render(extra=None):
+    # Format texte Prometheus
+    lines = ['# TYPE hotweels_stage_seconds histogram']
+    with _lock:
+        for (name, action), (buckets, total, count) in sorted(_histograms.items()):
+            for bound, value in zip(BUCKETS, buckets):
+                lines.append(f"hotweels_stage_seconds_bucket{_labels(stage=name, action=action, le=bound)} {value}")
+            lines.append(f"hotweels_stage_seconds_bucket{_labels(stage=name, action=action, le='+Inf')} {count}")
+            lines.append(f"hotweels_stage_seconds_sum{_labels(stage=name, action=action)} {total}")
+            lines.append(f"hotweels_stage_seconds_count{_labels(stage=name, action=action)} {count}")
+
+        names = sorted({name for name, _ in _counters})
+        for metric in names:
+            lines.append(f"# TYPE hotweels_{metric} counter")
+            for (name, action), value in sorted(_counters.items()):
+                if name == metric:
+                    lines.append(f"hotweels_{name}{_labels(action=action)} {value}")
+
+    for metric, value in sorted((extra or {}).items()):
+        lines.append(f"# TYPE hotweels_{metric} counter")
+        lines.append(f"hotweels_{metric} {value}")
+    return '\n'.join(lines) + '\n'
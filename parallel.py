@@ -0,0 +1,352 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+import metrics
+from metrics import stage
+from jobs import on_success, progress, found
+from columnar import Encoded, decode_ragged
+from rules import select_rules, rule_fields, encode_columns, evaluate_parsed
+from schema import missing_columns
+from sessions import new_session, session_source, session_schema, sheet_frame
+from streaming import stream_errors, stream_duplicates, stream_all
+from validation import (DUPLICATE_FIELDS, duplicate_rules, find_errors, find_duplicates, find_near_duplicates,
+                        error_hits, error_lines)
+from history import find_errors_incremental
+from registry import find_registered, register_sites
+from workbook import sheet_info
+
+
+# ----------------------
+# POOL DE PROCESSUS
+# ----------------------
+# Les contrôles sont du calcul pandas / Python : plusieurs feuilles ne vont
+# plus vite qu'en processus séparés. Le pool est créé à la première demande
+# et gardé (les processus ont déjà importé pandas), un processus par cœur
+# sauf PROCESS_WORKERS=... Les processus sont lancés par « spawn » : le
+# serveur a déjà des threads, un fork pourrait copier un verrou tenu.
+PROCESS_WORKERS = int(os.environ.get('PROCESS_WORKERS', 0)) or os.cpu_count() or 1
+
+_pool = None
+_lock = threading.Lock()
+
+
+def process_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PROCESS_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _reset_pool(pool):
+    # Processus tué (mémoire, signal) : le pool n'accepte plus rien
+    global _pool
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+# ----------------------
+# CONTRÔLES D'UNE FEUILLE
+# ----------------------
+# Les mêmes étapes pour /process (une ou plusieurs feuilles), les lots et
+# chaque processus du pool : colonnes requises, lecture (en entier ou par
+# blocs), contrôles, revalidation incrémentale et registre. Résultats :
+# {'errors': ..., 'doublons': ...} selon l'action, avec 'doublons_ignores'
+# (règles sans leurs colonnes), 'incremental' et 'registre' s'il y a lieu.
+def sheet_fields(action, rules):
+    # Colonnes sans lesquelles l'action est impossible
+    fields = []
+    if action != 'detect_duplicates':
+        fields += rule_fields(rules)
+    if action != 'detect_errors':
+        fields += DUPLICATE_FIELDS
+    return fields
+
+
+def _record_rules(timings, action):
+    # Durée de chaque règle (découpage des colonnes compris)
+    for rule_id, seconds in timings.items():
+        metrics.record('rule_' + rule_id, seconds, action)
+
+
+def check_errors(session, sheet_name, schema, rules, action='detect_errors', stats=None):
+    # stats : si fourni, revalidation incrémentale (lignes reprises /
+    # recontrôlées)
+    with stage('read', action):
+        df = sheet_frame(session, sheet_name)
+    metrics.inc('rows_processed_total', len(df), action)
+    progress(rows=0, rows_total=len(df))
+
+    timings = {}
+    with stage('validate_errors', action):
+        if stats is not None:
+            error_lines = find_errors_incremental(df, schema['first_row'], rules, timings, stats)
+        else:
+            # Très grande feuille : plages de lignes réparties sur le pool
+            error_lines = find_errors_parallel(df, schema['first_row'], rules, timings)
+    progress(rows=len(df))
+    found('errors', error_lines)
+    _record_rules(timings, action)
+    if stats is not None:
+        metrics.inc('rows_reused_total', stats['reused'], action)
+        metrics.inc('rows_recomputed_total', stats['recomputed'], action)
+    return error_lines
+
+
+def check_duplicates(session, sheet_name, schema, radius=None, action='detect_duplicates', known=None):
+    # known : si fourni, reçoit les sites déjà enregistrés sous un autre
+    # Identifiant (registre) ; la feuille y est enregistrée à son tour, une
+    # fois le traitement réussi
+    with stage('read', action):
+        df = sheet_frame(session, sheet_name)
+    metrics.inc('rows_processed_total', len(df), action)
+    progress(rows=0, rows_total=len(df))
+
+    with stage('validate_duplicates', action):
+        if radius:
+            doublons = find_near_duplicates(df, radius, schema['first_row'])
+        else:
+            doublons = find_duplicates(df, schema['first_row'])
+    progress(rows=len(df))
+    found('doublons', doublons)
+    if known is not None:
+        with stage('registry', action):
+            known += find_registered(df, schema['first_row'], radius)
+        metrics.inc('registry_matches_total', len(known), action)
+
+        def register():
+            with stage('registry_store', action):
+                register_sites(df, f"{session['filename']} / {sheet_name}")
+        on_success(register)
+    return doublons
+
+
+def check_sheet(session, sheet_name, action, radius=None, rules=None, streaming=False, incremental=False,
+                registry=False):
+    # streaming : lecture et contrôles mêlés, bloc par bloc (ni
+    # revalidation incrémentale ni registre, qui relisent la feuille)
+    rules = select_rules() if rules is None else rules
+    with stage('schema', action):
+        schema = session_schema(session, sheet_name)
+    missing = missing_columns(schema, sheet_fields(action, rules))
+    if missing:
+        raise ValueError("Colonnes introuvables : " + ", ".join(missing))
+
+    results = {}
+    if streaming:
+        timings = {}
+        source = session_source(session)
+        with stage('stream', action):
+            if action == 'all':
+                results['errors'], results['doublons'] = stream_all(source, sheet_name, schema, radius, rules,
+                                                                    timings)
+            elif action == 'detect_errors':
+                results['errors'] = stream_errors(source, sheet_name, schema, rules, timings)
+            else:
+                results['doublons'] = stream_duplicates(source, sheet_name, schema, radius)
+        _record_rules(timings, action)
+    else:
+        stats = {} if incremental else None
+        known = [] if registry else None
+        if action != 'detect_duplicates':
+            results['errors'] = check_errors(session, sheet_name, schema, rules, action, stats)
+        if action != 'detect_errors':
+            results['doublons'] = check_duplicates(session, sheet_name, schema, radius, action, known)
+        if stats:
+            results['incremental'] = stats
+        if known is not None:
+            results['registre'] = known
+    if action != 'detect_errors':
+        # Règles de doublons sans leurs colonnes dans la feuille
+        _, skipped = duplicate_rules(schema['columns'])
+        if skipped:
+            results['doublons_ignores'] = skipped
+    return results
+
+
+# ----------------------
+# PLUSIEURS FEUILLES
+# ----------------------
+# Une feuille par tâche, les plus grandes d'abord (nombre de lignes déclaré
+# par <dimension>) : la durée totale est alors proche de celle de la plus
+# grande feuille. Chaque processus reçoit les octets du classeur et ne lit
+# que sa feuille ; seuls les résultats reviennent. Avec le registre, les
+# feuilles sont contrôlées sur place : leurs sites sont enregistrés par le
+# traitement, une fois réussi (jobs.on_success).
+def _pool_check_sheet(data, sheet_name, action, radius, rule_ids, streaming, incremental):
+    # Dans un processus du pool : résultats et durées des étapes, que le
+    # serveur enregistre à son tour
+    session = new_session(sheet_name, data)
+    args = (session, sheet_name, action, radius, select_rules(rule_ids), streaming, incremental)
+    if not metrics.ENABLED:
+        return check_sheet(*args), None
+    timings = metrics.begin_timings()
+    try:
+        return check_sheet(*args), timings
+    finally:
+        metrics.end_timings()
+
+
+def check_sheets(session, sheets, action, radius=None, rules=None, streaming=False, in_process=None,
+                 incremental=False, registry=False):
+    # [(feuille, résultats ou exception)], dans l'ordre de sheets. Une
+    # feuille en échec (colonnes absentes...) n'arrête pas les autres.
+    # in_process : contrôles sur place (par défaut pour une seule feuille)
+    rules = select_rules() if rules is None else rules
+    if in_process is None:
+        in_process = len(sheets) == 1
+    progress(sheets=0, sheets_total=len(sheets))
+    if in_process or registry or PROCESS_WORKERS == 1:
+        outcomes = {}
+        for sheet_name in sheets:
+            try:
+                outcomes[sheet_name] = check_sheet(session, sheet_name, action, radius, rules, streaming,
+                                                   incremental, registry), None
+            except Exception as e:
+                outcomes[sheet_name] = e
+            progress(sheets=len(outcomes))
+    else:
+        args = (action, radius, [rule['id'] for rule in rules], streaming, incremental)
+        rows = {sheet['name']: sheet['rows'] or 0 for sheet in sheet_info(session_source(session))}
+        pool = process_pool()
+        futures = {name: pool.submit(_pool_check_sheet, session['data'], name, *args)
+                   for name in sorted(sheets, key=lambda name: -rows.get(name, 0))}
+        outcomes = {}
+        for sheet_name, future in futures.items():
+            try:
+                outcomes[sheet_name] = future.result()
+            except BrokenProcessPool as e:
+                _reset_pool(pool)
+                outcomes[sheet_name] = e
+            except Exception as e:
+                outcomes[sheet_name] = e
+            progress(sheets=len(outcomes))
+
+    results = []
+    for sheet_name in sheets:
+        outcome = outcomes[sheet_name]
+        if isinstance(outcome, Exception):
+            results.append((sheet_name, outcome))
+            continue
+        sheet_results, timings = outcome
+        # Étapes mesurées dans le processus de la feuille
+        for name, seconds in timings or []:
+            metrics.record(name, seconds, action)
+        results.append((sheet_name, sheet_results))
+    return results
+
+
+# ----------------------
+# BLOCS DE LIGNES (mémoire partagée)
+# ----------------------
+# Les règles d'erreur sont indépendantes d'une ligne à l'autre : pour une
+# très grande feuille, les colonnes sont codées une fois ici (un code par
+# ligne et les textes distincts déjà découpés, columnar.encode_ragged),
+# copiées dans un seul bloc de mémoire partagée, et chaque processus du
+# pool reconstitue les colonnes d'une plage de lignes, évalue les règles
+# et rédige les messages. Le DataFrame n'est jamais envoyé : seuls le nom
+# du bloc, sa disposition et les bornes de la plage le sont. Le bloc est
+# supprimé par le serveur (les processus du pool partagent son suivi des
+# ressources). Les plages étant dans l'ordre, les erreurs se recollent à
+# la suite. En dessous de PARALLEL_MIN_ROWS lignes, lancer les tâches
+# coûte plus que ce qu'elles font gagner : tout reste dans le processus
+# courant.
+PARALLEL_MIN_ROWS = int(os.environ.get('PARALLEL_MIN_ROWS', 100000))
+PARALLEL_CHUNK_ROWS = 50000  # plage minimale par processus
+
+
+def _share(encoded):
+    # codes, values et offsets de chaque colonne, à la suite dans un seul
+    # bloc ; disposition : nom -> ((début, taille, type) de chaque tableau)
+    layout = {}
+    size = 0
+    for name, col in encoded.items():
+        layout[name] = []
+        for array in col:
+            layout[name].append((size, array.size, array.dtype.str))
+            size += array.nbytes
+    shm = SharedMemory(create=True, size=max(size, 1))
+    for name, col in encoded.items():
+        for array, (at, count, dtype) in zip(col, layout[name]):
+            np.ndarray(count, dtype, shm.buf, at)[:] = array
+    return shm, layout
+
+
+def _range_hits(buf, layout, rule_ids, start, stop):
+    # Colonnes des lignes [start, stop), lues dans le bloc sans copie
+    parsed = {}
+    for name, arrays in layout.items():
+        col = Encoded(*(np.ndarray(count, dtype, buf, at) for at, count, dtype in arrays))
+        parsed[name] = decode_ragged(col, start, stop)
+    timings = {}
+    checks = evaluate_parsed(parsed, stop - start, select_rules(rule_ids), timings)
+    rows, order, messages = error_hits(checks)
+    return rows + start, order, messages, timings
+
+
+def _check_rows(shm_name, layout, rule_ids, start, stop):
+    # Dans un processus du pool : erreurs des lignes [start, stop). En cas
+    # d'erreur, les vues sur le bloc restent référencées par la trace : il
+    # est alors refermé par le ramasse-miettes.
+    shm = SharedMemory(name=shm_name)
+    result = _range_hits(shm.buf, layout, rule_ids, start, stop)
+    shm.close()
+    return result
+
+
+def _row_ranges(size):
+    # Crossover : une plage par processus, d'au moins PARALLEL_CHUNK_ROWS
+    # lignes ; une seule plage -> pas de parallélisme. Déjà dans un
+    # processus du pool (une feuille parmi d'autres) : pas de second niveau.
+    if size < PARALLEL_MIN_ROWS or PROCESS_WORKERS == 1 or multiprocessing.parent_process() is not None:
+        return [(0, size)]
+    parts = max(1, min(PROCESS_WORKERS, size // PARALLEL_CHUNK_ROWS))
+    bounds = np.linspace(0, size, parts + 1).astype(np.int64).tolist()
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def find_errors_parallel(df, first_row, rules=None, timings=None):
+    # Même résultat que validation.find_errors, plages de lignes réparties
+    # sur le pool de processus quand la feuille est assez grande
+    rules = select_rules() if rules is None else rules
+    ranges = _row_ranges(len(df))
+    if len(ranges) == 1:
+        return find_errors(df, first_row, rules, timings)
+
+    with stage('encode'):
+        shm, layout = _share(encode_columns(df, rules))
+    try:
+        pool = process_pool()
+        rule_ids = [rule['id'] for rule in rules]
+        futures = [pool.submit(_check_rows, shm.name, layout, rule_ids, start, stop) for start, stop in ranges]
+        try:
+            parts = []
+            for future, (_, stop) in zip(futures, ranges):
+                parts.append(future.result())
+                progress(rows=stop)
+        except BrokenProcessPool:
+            _reset_pool(pool)
+            raise
+    finally:
+        shm.close()
+        shm.unlink()
+
+    messages = []
+    for _, _, part_messages, part_timings in parts:
+        messages += part_messages
+        if timings is not None:
+            # Temps cumulé des processus (et non durée écoulée)
+            for rule_id, seconds in part_timings.items():
+                timings[rule_id] = timings.get(rule_id, 0.0) + seconds
+    rows = np.concatenate([part[0] for part in parts])
+    order = np.concatenate([part[1] for part in parts])
+    return error_lines(df, first_row, rules, rows, order, messages)
@@ -0,0 +1,322 @@
+import math
+import os
+import posixpath
+import zipfile
+from itertools import islice
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from openpyxl.reader.strings import read_string_table
+from openpyxl.styles.stylesheet import Stylesheet
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+from pandas.io.parsers import TextParser
+
+from highlight import NS_MAIN, NS_PKG_REL, sheet_paths
+
+
+# ----------------------
+# LECTEURS DE FEUILLES
+# ----------------------
+# Deux implémentations, mêmes résultats que pd.read_excel :
+#   - 'fast' : le XML de la feuille est parcouru directement (iterparse),
+#     les chaînes partagées ne sont chargées qu'à la première cellule qui
+#     en a besoin, et seules les colonnes demandées (usecols) sont
+#     converties puis typées ;
+#   - 'openpyxl' : pd.read_excel, utilisé en secours si le lecteur rapide
+#     échoue sur un classeur atypique.
+# XLSX_READER=openpyxl force le second.
+DEFAULT_READER = os.environ.get('XLSX_READER', 'fast')
+
+ROW_TAG = NS_MAIN + 'row'
+CELL_TAG = NS_MAIN + 'c'
+VALUE_TAG = NS_MAIN + 'v'
+INLINE_TAG = NS_MAIN + 'is'
+TEXT_TAG = NS_MAIN + 't'
+RUN_TAG = NS_MAIN + 'r'
+SHARED_STRINGS_TYPE = '/sharedStrings'
+
+# Cellule hors des colonnes demandées : non convertie, mais non vide
+SKIPPED = object()
+
+
+def _convert_cell(cell):
+    # Conversion d'une cellule openpyxl, comme le lecteur openpyxl de pandas
+    if cell.value is None:
+        return ''
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+
+def _inline_text(node):
+    # Texte d'une chaîne inline, comme openpyxl (Text.content) : <t> puis
+    # le <t> de chaque <r>, sans les annotations phonétiques (<rPh>)
+    plain = node.find(TEXT_TAG)
+    parts = [plain.text or ''] if plain is not None else []
+    for run in node.iterfind(RUN_TAG):
+        text = run.find(TEXT_TAG)
+        if text is not None and text.text is not None:
+            parts.append(text.text)
+    return ''.join(parts)
+
+
+def _column_index(ref, cache={}):
+    # "AB12" -> 28 (colonnes numérotées à partir de 1)
+    letters = ref.rstrip('0123456789')
+    index = cache.get(letters)
+    if index is None:
+        index = 0
+        for letter in letters:
+            index = index * 26 + ord(letter) - 64
+        cache[letters] = index
+    return index
+
+
+class _Workbook:
+    # Ce que le lecteur rapide doit connaître du classeur, hors feuilles
+    def __init__(self, zin):
+        self.zin = zin
+        self.sheets = sheet_paths(zin)
+
+        workbook = ET.fromstring(zin.read('xl/workbook.xml'))
+        props = workbook.find(NS_MAIN + 'workbookPr')
+        date1904 = props is not None and props.get('date1904') in ('1', 'true')
+        self.epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+
+        try:
+            styles = Stylesheet.from_tree(ET.fromstring(zin.read('xl/styles.xml')))
+            self.date_formats = styles.date_formats
+            self.timedelta_formats = styles.timedelta_formats
+        except KeyError:
+            self.date_formats = self.timedelta_formats = set()
+
+        self.strings_path = None
+        rels = ET.fromstring(zin.read('xl/_rels/workbook.xml.rels'))
+        for rel in rels.iter(NS_PKG_REL + 'Relationship'):
+            if rel.get('Type', '').endswith(SHARED_STRINGS_TYPE):
+                target = rel.get('Target')
+                self.strings_path = target[1:] if target.startswith('/') else posixpath.join('xl', target)
+        self._strings = None
+
+    @property
+    def strings(self):
+        # Table des chaînes partagées, lue à la première demande
+        if self._strings is None:
+            if self.strings_path:
+                with self.zin.open(self.strings_path) as src:
+                    self._strings = read_string_table(src)
+            else:
+                self._strings = []
+        return self._strings
+
+    def value(self, cell):
+        # Comme openpyxl (WorkSheetParser.parse_cell), puis pandas (_convert_cell)
+        data_type = cell.get('t', 'n')
+        if data_type == 'inlineStr':
+            child = cell.find(INLINE_TAG)
+            return _inline_text(child) if child is not None else ''
+
+        value = cell.findtext(VALUE_TAG) or None
+        if value is None:
+            return ''
+        if data_type == 'n':
+            number = float(value) if ('.' in value or 'E' in value or 'e' in value) else int(value)
+            style = int(cell.get('s', 0))
+            if style in self.date_formats:
+                try:
+                    return from_excel(number, self.epoch, timedelta=style in self.timedelta_formats)
+                except (OverflowError, ValueError):
+                    return np.nan  # date hors limites : erreur pour openpyxl
+            if isinstance(number, float) and math.isfinite(number) and number == int(number):
+                return int(number)
+            return number
+        if data_type == 's':
+            return self.strings[int(value)]
+        if data_type == 'b':
+            return bool(int(value))
+        if data_type == 'd':
+            return from_ISO8601(value)
+        if data_type == 'e':
+            return np.nan
+        return value  # 'str' : résultat texte d'une formule
+
+    def rows(self, sheet_name, keep=None, stop=None):
+        # Lignes de la feuille (listes de valeurs, sans cellules vides en
+        # fin de ligne), lignes absentes du XML comprises. keep : colonnes
+        # (0, 1, ...) à convertir, les autres valent SKIPPED.
+        counter = 0
+        with self.zin.open(self.sheets[sheet_name]) as src:
+            for _, elem in ET.iterparse(src):
+                if elem.tag != ROW_TAG:
+                    continue
+
+                number = elem.get('r')
+                number = int(number) if number else counter + 1
+                while counter + 1 < number:
+                    counter += 1
+                    yield []
+                    if stop is not None and counter >= stop:
+                        return
+                counter = number
+
+                cells = {}
+                column = 0
+                for cell in elem:
+                    if cell.tag != CELL_TAG:
+                        continue
+                    ref = cell.get('r')
+                    column = _column_index(ref) if ref else column + 1
+                    if keep is None or column - 1 in keep:
+                        cells[column] = self.value(cell)
+                    elif cell.get('t') == 'inlineStr' or cell.findtext(VALUE_TAG):
+                        cells[column] = SKIPPED
+                elem.clear()
+
+                values = [''] * (max(cells) if cells else 0)
+                for column, value in cells.items():
+                    values[column - 1] = value
+                while values and values[-1] == '':
+                    values.pop()
+                yield values
+                if stop is not None and counter >= stop:
+                    return
+
+
+def _pad(rows, width):
+    return [row + [''] * (width - len(row)) for row in rows]
+
+
+def _header_names(head, header, width):
+    # Noms des colonnes tels que pandas les construit (Unnamed: n, .1, .2)
+    if not head or header >= len(head):
+        raise ValueError('Ligne d\'en-tête absente')
+    return TextParser(_pad(head, width), header=header).read().columns
+
+
+def _selected(names, usecols):
+    # usecols : positions (entiers) ou noms (comparés sans espaces autour)
+    if usecols is None:
+        return list(range(len(names)))
+    wanted = set(usecols)
+    return [i for i, name in enumerate(names) if i in wanted or str(name).strip() in wanted]
+
+
+def read_sheet_fast(source, sheet_name, header, usecols=None):
+    with zipfile.ZipFile(source) as zin:
+        book = _Workbook(zin)
+        if sheet_name not in book.sheets:
+            raise ValueError(f"Worksheet named '{sheet_name}' not found")
+
+        keep = None
+        if usecols is not None:
+            head = list(book.rows(sheet_name, stop=header + 1))
+            names = _header_names(head, header, max((len(row) for row in head), default=0))
+            # Les positions demandées au-delà de l'en-tête sont gardées aussi
+            keep = set(_selected(names, usecols)) | {u for u in usecols if isinstance(u, int)}
+
+        head = []
+        data = []
+        blank = 0
+        width = 0
+        for number, row in enumerate(book.rows(sheet_name, keep)):
+            if number <= header:
+                head.append(row)
+            elif not row:
+                blank += 1  # ignorées si elles terminent la feuille
+                continue
+            else:
+                data.extend([] for _ in range(blank))
+                blank = 0
+                data.append(row)
+            width = max(width, len(row))
+
+    names = _header_names(head, header, width)
+    positions = _selected(names, usecols)
+    rows = [[row[i] if i < len(row) else '' for i in positions] for row in data]
+    frame = TextParser(rows, names=[names[i] for i in positions], header=None,
+                       skip_blank_lines=False).read()
+    return frame
+
+
+def read_sheet_openpyxl(source, sheet_name, header, usecols=None):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    df = pd.read_excel(source, sheet_name=sheet_name, header=header, engine='openpyxl')
+    if usecols is None:
+        return df
+    return df.iloc[:, _selected(df.columns, usecols)]
+
+
+def iter_rows_openpyxl(source, sheet_name):
+    wb = load_workbook(source, read_only=True, data_only=True, keep_links=False)
+    try:
+        ws = wb[sheet_name]
+        ws.reset_dimensions()
+        for row in ws.iter_rows():
+            values = [_convert_cell(cell) for cell in row]
+            while values and values[-1] == '':
+                values.pop()
+            yield values
+    finally:
+        wb.close()
+
+
+def iter_rows_fast(source, sheet_name):
+    with zipfile.ZipFile(source) as zin:
+        yield from _Workbook(zin).rows(sheet_name)
+
+
+def iter_rows(source, sheet_name, reader=None):
+    # Lignes brutes de la feuille, pour la lecture par blocs (streaming.py)
+    reader = reader or DEFAULT_READER
+    if reader != 'openpyxl':
+        try:
+            zin = zipfile.ZipFile(source)
+            book = _Workbook(zin)
+            book.sheets[sheet_name]
+        except FALLBACK_ERRORS:
+            pass
+        else:
+            return _closing_rows(zin, book.rows(sheet_name))
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return iter_rows_openpyxl(source, sheet_name)
+
+
+def _closing_rows(zin, rows):
+    with zin:
+        yield from rows
+
+
+def read_head(source, sheet_name, count, reader=None):
+    # Les count premières lignes de la feuille (brutes), sans lire la suite
+    rows = iter_rows(source, sheet_name, reader)
+    try:
+        return list(islice(rows, count))
+    finally:
+        rows.close()
+
+
+READERS = {
+    'fast': (read_sheet_fast, iter_rows_fast),
+    'openpyxl': (read_sheet_openpyxl, iter_rows_openpyxl)
+}
+
+# Classeur que le lecteur rapide ne sait pas lire : on passe par openpyxl
+FALLBACK_ERRORS = (KeyError, IndexError, ValueError, zipfile.BadZipFile, ET.ParseError)
+
+
+def read_sheet(source, sheet_name, header, usecols=None, reader=None):
+    reader = reader or DEFAULT_READER
+    if reader != 'openpyxl':
+        try:
+            return READERS[reader][0](source, sheet_name, header, usecols)
+        except FALLBACK_ERRORS:
+            pass
+    return read_sheet_openpyxl(source, sheet_name, header, usecols)
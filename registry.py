@@ -0,0 +1,207 @@
+import math
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from spatial import EARTH_RADIUS_M, haversine_m
+from validation import DATA_START_ROW, _coordonnees
+
+
+# ----------------------
+# REGISTRE DES SITES (doublons entre fichiers)
+# ----------------------
+# Chaque contrôle de doublons ne voit que la feuille envoyée. Le registre
+# garde, d'un envoi à l'autre, l'identifiant et les coordonnées de chaque
+# site contrôlé (base SQLite locale) : un site déclaré par deux opérateurs,
+# ou redéclaré sous un nouvel Identifiant au trimestre suivant, y est
+# retrouvé sans relire les anciens fichiers.
+#
+# Coordonnées identiques : index (latitude, longitude). Mode « proche » :
+# index R-tree (une boîte par site), interrogé avec la boîte de chaque
+# ligne élargie du rayon, puis distance exacte (haversine). Les lignes de
+# la feuille passent par une table temporaire : une seule requête pour
+# toute la feuille, chaque ligne ne parcourt que sa branche de l'index.
+#
+# Un site enregistré dont l'Identifiant figure dans la feuille est remplacé
+# par sa déclaration actuelle : il n'est pas comparé (les doublons
+# internes à la feuille restent ceux de find_duplicates). La recherche ne
+# fait que lire ; les sites de la feuille sont ajoutés ou mis à jour en
+# bloc par register_sites, une fois le traitement réussi, dans une
+# transaction BEGIN IMMEDIATE (plusieurs processus serveur peuvent écrire
+# dans la même base).
+REGISTRY_PATH = os.environ.get('REGISTRY_PATH', 'registry.sqlite3')
+
+_METRES_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+
+
+def _connect():
+    # Transactions explicites (_transaction)
+    db = sqlite3.connect(REGISTRY_PATH, timeout=30, isolation_level=None)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('CREATE TABLE IF NOT EXISTS sites (id INTEGER PRIMARY KEY, identifiant TEXT UNIQUE,'
+               ' latitude REAL, longitude REAL, source TEXT, updated REAL)')
+    db.execute('CREATE INDEX IF NOT EXISTS sites_coords ON sites (latitude, longitude)')
+    db.execute('CREATE VIRTUAL TABLE IF NOT EXISTS site_boxes USING rtree(id, min_lat, max_lat, min_lon, max_lon)')
+    return db
+
+
+@contextmanager
+def _transaction(db, mode='DEFERRED'):
+    db.execute('BEGIN ' + mode)
+    try:
+        yield
+    except BaseException:
+        db.execute('ROLLBACK')
+        raise
+    db.execute('COMMIT')
+
+
+def _identifiants(series):
+    # Texte de chaque Identifiant (12345.0 -> "12345", comme dans la
+    # feuille) ; None si vide
+    missing = series.isna().tolist()
+    return [None if empty else
+            str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+            for value, empty in zip(series.tolist(), missing)]
+
+
+def _margins(latitude, radius):
+    # Demi-côtés (en degrés) de la boîte qui contient le cercle de rayon
+    # radius autour de chaque point ; la longitude est mesurée à la
+    # latitude la plus éloignée de l'équateur dans la boîte
+    dlat = radius / _METRES_PER_DEGREE
+    widest = np.minimum(np.abs(latitude) + dlat, 90.0)
+    cos = np.cos(np.radians(widest))
+    dlon = np.where(cos > 1e-9, dlat / np.maximum(cos, 1e-9), 360.0)
+    return np.full(latitude.size, dlat), np.minimum(dlon, 360.0)
+
+
+EXACT_QUERY = """
+    SELECT p.pos, s.identifiant, s.latitude, s.longitude, s.source
+    FROM probe p JOIN sites s ON s.latitude = p.latitude AND s.longitude = p.longitude
+    WHERE s.identifiant NOT IN (SELECT identifiant FROM sheet_sites)
+"""
+
+NEAR_QUERY = """
+    SELECT p.pos, s.identifiant, s.latitude, s.longitude, s.source
+    FROM probe p
+    JOIN site_boxes b ON b.max_lat >= p.latitude - p.dlat AND b.min_lat <= p.latitude + p.dlat
+                     AND b.max_lon >= p.longitude - p.dlon AND b.min_lon <= p.longitude + p.dlon
+    JOIN sites s ON s.id = b.id
+    WHERE s.identifiant NOT IN (SELECT identifiant FROM sheet_sites)
+"""
+
+
+def _sheet(df):
+    # (lignes localisées, latitudes, longitudes, leurs Identifiants, ceux
+    # des lignes sans coordonnées)
+    df, df_coords = _coordonnees(df)
+    latitude = df_coords['Latitude'].to_numpy(dtype=np.float64)
+    longitude = df_coords['Longitude'].to_numpy(dtype=np.float64)
+    identifiants = pd.Series(_identifiants(df['Identifiant']), index=df.index, dtype=object)
+    return (df_coords, latitude, longitude, identifiants[df_coords.index].tolist(),
+            identifiants.drop(df_coords.index).tolist())
+
+
+def _sheet_sites(db, latitude, longitude, identifiants, others):
+    # Identifiants de la feuille, avec les coordonnées de leur première
+    # ligne localisée ; others : ceux des lignes sans coordonnées
+    db.execute('CREATE TEMP TABLE sheet_sites (identifiant TEXT PRIMARY KEY, latitude REAL, longitude REAL)')
+    db.executemany('INSERT OR IGNORE INTO sheet_sites VALUES (?, ?, ?)',
+                   ((value, lat, lon) for value, lat, lon in zip(identifiants, latitude.tolist(), longitude.tolist())
+                    if value is not None))
+    db.executemany('INSERT OR IGNORE INTO sheet_sites VALUES (?, NULL, NULL)',
+                   ((value,) for value in others if value is not None))
+
+
+def _matches(db, latitude, longitude, radius):
+    # [(position, identifiant, latitude, longitude, source)] des sites
+    # enregistrés sous un autre Identifiant que ceux de la feuille
+    db.execute('CREATE TEMP TABLE probe (pos INTEGER PRIMARY KEY, latitude REAL, longitude REAL, dlat REAL, dlon REAL)')
+    if radius:
+        dlat, dlon = _margins(latitude, radius)
+    else:
+        dlat = dlon = np.zeros(latitude.size)
+    db.executemany('INSERT INTO probe VALUES (?, ?, ?, ?, ?)',
+                   zip(range(latitude.size), latitude.tolist(), longitude.tolist(), dlat.tolist(), dlon.tolist()))
+    return db.execute(NEAR_QUERY if radius else EXACT_QUERY).fetchall()
+
+
+def _register(db, source, now):
+    # Ajout des sites nouveaux, mise à jour de ceux déplacés ou déclarés
+    # ailleurs (updated : date du dernier changement) ; les boîtes ne sont
+    # réécrites que pour les sites nouveaux ou déplacés
+    db.execute('INSERT INTO sites (identifiant, latitude, longitude, source, updated)'
+               ' SELECT identifiant, latitude, longitude, ?, ? FROM sheet_sites WHERE latitude IS NOT NULL'
+               ' ON CONFLICT (identifiant) DO UPDATE SET latitude = excluded.latitude,'
+               ' longitude = excluded.longitude, source = excluded.source, updated = excluded.updated'
+               ' WHERE latitude IS NOT excluded.latitude OR longitude IS NOT excluded.longitude'
+               ' OR source IS NOT excluded.source',
+               (source, now))
+    db.execute('INSERT OR REPLACE INTO site_boxes'
+               ' SELECT s.id, s.latitude, s.latitude, s.longitude, s.longitude'
+               ' FROM sheet_sites i JOIN sites s ON s.identifiant = i.identifiant'
+               ' LEFT JOIN site_boxes b ON b.id = s.id'
+               ' WHERE i.latitude IS NOT NULL AND (b.id IS NULL OR NOT (b.min_lat <= s.latitude'
+               ' AND s.latitude <= b.max_lat AND b.min_lon <= s.longitude AND s.longitude <= b.max_lon))')
+
+
+def find_registered(df, first_row=DATA_START_ROW + 1, radius_m=None):
+    # Lignes dont les coordonnées (à radius_m mètres près) sont celles d'un
+    # site enregistré sous un autre Identifiant ; le registre n'est pas
+    # modifié (register_sites)
+    df_coords, latitude, longitude, identifiants, others = _sheet(df)
+
+    db = _connect()
+    try:
+        with _transaction(db):
+            _sheet_sites(db, latitude, longitude, identifiants, others)
+            found = _matches(db, latitude, longitude, radius_m)
+    finally:
+        db.close()
+
+    if not found:
+        return []
+    pos, known, known_lat, known_lon, sources = map(list, zip(*found))
+    pos = np.array(pos, dtype=np.int64)
+    distance = haversine_m(latitude[pos], longitude[pos], np.array(known_lat), np.array(known_lon))
+    if radius_m:
+        close = distance <= radius_m
+    else:
+        close = np.ones(pos.size, dtype=bool)
+
+    rows = df_coords.index.to_numpy()[pos]
+    order = [k for k in np.lexsort((distance, rows)).tolist() if close[k]]
+    values = df_coords['Identifiant'].tolist()
+    latitudes = df_coords['Latitude'].tolist()
+    longitudes = df_coords['Longitude'].tolist()
+    results = []
+    for k in order:
+        i = pos[k]
+        results.append({
+            "Ligne": int(rows[k]) + first_row,
+            "Identifiant": values[i],
+            "Latitude": latitudes[i],
+            "Longitude": longitudes[i],
+            "Identifiant connu": known[k],
+            "Source": sources[k],
+            "Distance (m)": round(float(distance[k]), 1)
+        })
+    return results
+
+
+def register_sites(df, source=''):
+    # Ajout ou mise à jour des sites de la feuille, source : "fichier /
+    # feuille" ; verrou d'écriture de la base dès le début de la transaction
+    _, latitude, longitude, identifiants, others = _sheet(df)
+    db = _connect()
+    try:
+        with _transaction(db, 'IMMEDIATE'):
+            _sheet_sites(db, latitude, longitude, identifiants, others)
+            _register(db, source, time.time())
+    finally:
+        db.close()
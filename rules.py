@@ -0,0 +1,210 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+import yaml
+
+from columnar import parse_ragged, encode_ragged, ragged_lengths, count_mismatch, values_mismatch
+
+
+# ----------------------
+# RÈGLES DÉCLARATIVES (rules.yaml)
+# ----------------------
+# Le fichier est lu une fois, au chargement du module. Chaque règle est
+# compilée en une fonction sur colonnes entières : (colonnes, masque des
+# lignes contrôlées) -> (lignes en erreur, champs du message). Les colonnes
+# sont découpées une seule fois par évaluation (_Columns), quel que soit le
+# nombre de règles qui les utilisent.
+RULES_FILE = os.environ.get('RULES_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.yaml'))
+
+DEFAULT_MESSAGES = {
+    'count': "{label}: {count} ≠ {reference_count}",
+    'same_values': "{label} ≠ référence",
+    'range': "{label}: hors [{min}, {max}]"
+}
+
+
+class _Columns:
+    # Colonnes découpées (parse_ragged) et longueurs, à la demande ;
+    # parsed : colonnes déjà découpées
+    def __init__(self, df, parsed=None):
+        self.df = df
+        self.parsed = dict(parsed or {})
+        self.lengths = {}
+
+    def ragged(self, name):
+        if name not in self.parsed:
+            self.parsed[name] = parse_ragged(self.df[name])
+        return self.parsed[name]
+
+    def counts(self, name):
+        if name not in self.lengths:
+            self.lengths[name] = ragged_lengths(self.ragged(name))
+        return self.lengths[name]
+
+
+def _count(rule):
+    def evaluate(columns, active):
+        lengths = columns.counts(rule['column'])
+        ref_lengths = columns.counts(rule['reference'])
+        mask = count_mismatch(lengths, ref_lengths, active)
+        return mask, {'count': lengths, 'reference_count': ref_lengths}
+    return evaluate
+
+
+def _same_values(rule):
+    def evaluate(columns, active):
+        mask = values_mismatch(columns.ragged(rule['column']), columns.ragged(rule['reference']), active)
+        return mask, {}
+    return evaluate
+
+
+def _range(rule):
+    low, high = float(rule['min']), float(rule['max'])
+
+    def evaluate(columns, active):
+        col = columns.ragged(rule['column'])
+        lengths = columns.counts(rule['column'])
+        outside = ((col.values < low) | (col.values > high)).astype(np.int64)
+        # Nombre de valeurs hors limites par ligne (lignes vides : 0)
+        totals = np.zeros(len(lengths), dtype=np.int64)
+        filled = np.flatnonzero(lengths > 0)
+        if filled.size:
+            totals[filled] = np.add.reduceat(outside, col.offsets[filled])
+        return active & (totals > 0), {}
+    return evaluate
+
+
+RULE_TYPES = {
+    'count': _count,
+    'same_values': _same_values,
+    'range': _range
+}
+
+
+def _column(columns, ref):
+    # "2G.tilt" -> nom de la colonne dans la feuille
+    gen, _, field = ref.partition('.')
+    try:
+        return columns[gen][field]
+    except KeyError:
+        raise ValueError(f"Règle : colonne inconnue « {ref} »")
+
+
+def _compile(spec, columns, when):
+    if spec.get('type') not in RULE_TYPES:
+        raise ValueError(f"Règle {spec.get('id')} : type inconnu « {spec.get('type')} »")
+    rule = {
+        'id': str(spec['id']),
+        'type': spec['type'],
+        'column': _column(columns, spec['column']),
+        'reference': _column(columns, spec['reference']) if 'reference' in spec else None,
+        'when': _column(columns, spec.get('when', when)) if spec.get('when', when) else None,
+        'enabled': spec.get('enabled', True),
+        'min': spec.get('min'),
+        'max': spec.get('max')
+    }
+    label = spec.get('label', rule['id'])
+    rule['message'] = spec.get('message', DEFAULT_MESSAGES[rule['type']]).replace('{label}', label)
+    rule['evaluate'] = RULE_TYPES[rule['type']](rule)
+    rule['fields'] = [name for name in (rule['column'], rule['reference'], rule['when']) if name]
+    return rule
+
+
+def _field(columns, ref):
+    # "2G.freq" -> nom de la colonne ; un nom de la feuille (Identifiant,
+    # Latitude...) est pris tel quel
+    gen, dot, _ = ref.partition('.')
+    return _column(columns, ref) if dot and gen in columns else ref
+
+
+def _duplicate(spec, columns):
+    # Règle de doublons : lignes de même key (toutes ces colonnes égales)
+    # et de distinct différents
+    for name in ('id', 'key', 'distinct'):
+        if not spec.get(name):
+            raise ValueError(f"Doublons {spec.get('id')} : « {name} » manquant")
+    return {
+        'id': str(spec['id']),
+        'key': [_field(columns, ref) for ref in spec['key']],
+        'distinct': [_field(columns, ref) for ref in spec['distinct']],
+        'label': spec.get('label', str(spec['id'])),
+        'enabled': spec.get('enabled', True)
+    }
+
+
+def load_rules(path=RULES_FILE):
+    with open(path, 'rb') as f:
+        data = f.read()
+    spec = yaml.safe_load(data)
+    columns = spec['columns']
+    rules = [_compile(rule, columns, spec.get('when')) for rule in spec['rules']]
+    duplicates = [_duplicate(rule, columns) for rule in spec.get('duplicates', [])]
+    for group in (rules, duplicates):
+        ids = [rule['id'] for rule in group]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Règles : identifiants en double")
+    return columns, rules, duplicates, hashlib.sha256(data).hexdigest()[:16]
+
+
+COLUMNS, RULES, DUPLICATE_RULES, RULES_DIGEST = load_rules()
+RULES_BY_ID = {rule['id']: rule for rule in RULES}
+
+
+def select_rules(ids=None):
+    # ids : identifiants demandés (sinon les règles actives par défaut)
+    if not ids:
+        return [rule for rule in RULES if rule['enabled']]
+    unknown = [i for i in ids if i not in RULES_BY_ID]
+    if unknown:
+        raise ValueError("Règles inconnues : " + ", ".join(unknown))
+    wanted = set(ids)
+    return [rule for rule in RULES if rule['id'] in wanted]
+
+
+def rules_version(rules):
+    # Pour la clé du cache : contenu du fichier et règles retenues
+    return RULES_DIGEST + ':' + ','.join(rule['id'] for rule in rules)
+
+
+def rule_fields(rules):
+    # Colonnes à lire pour ces règles, sans doublons
+    fields = []
+    for rule in rules:
+        for name in rule['fields']:
+            if name not in fields:
+                fields.append(name)
+    return fields
+
+
+def encode_columns(df, rules):
+    # Colonnes des règles, sous forme codée : nom -> Encoded
+    return {name: encode_ragged(df[name]) for name in rule_fields(rules)}
+
+
+def evaluate_rules(df, rules, timings=None):
+    # [(règle, masque des lignes en erreur, champs du message)] ; timings :
+    # secondes cumulées par règle (découpage des colonnes compris)
+    return _evaluate(_Columns(df), len(df), rules, timings)
+
+
+def evaluate_parsed(parsed, size, rules, timings=None):
+    # Comme evaluate_rules, sur des colonnes déjà découpées (nom -> Ragged)
+    # de size lignes
+    return _evaluate(_Columns(None, parsed), size, rules, timings)
+
+
+def _evaluate(columns, size, rules, timings):
+    results = []
+    for rule in rules:
+        start = time.perf_counter()
+        if rule['when']:
+            active = columns.counts(rule['when']) > 0
+        else:
+            active = np.ones(size, dtype=bool)
+        mask, fields = rule['evaluate'](columns, active)
+        results.append((rule, mask, fields))
+        if timings is not None:
+            timings[rule['id']] = timings.get(rule['id'], 0.0) + time.perf_counter() - start
+    return results
@@ -0,0 +1,163 @@
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+from readers import read_head, read_sheet
+from validation import HEADER_ROW, COLS, DUPLICATE_FIELDS, DUPLICATE_EXTRA
+
+
+# ----------------------
+# SCHÉMA DE LA FEUILLE (ligne d'en-tête et colonnes utiles)
+# ----------------------
+# Seules les SCHEMA_ROWS premières lignes sont inspectées : la ligne
+# d'en-tête est celle qui contient le plus de noms connus (COLS, et
+# Identifiant / Longitude / Latitude), comparés sans accents ni casse et
+# avec une tolérance aux fautes de frappe (« Tits mécanques »). Le résultat
+# (position de chaque colonne utile) est gardé par empreinte de la ligne
+# d'en-tête : les envois suivants du même modèle ne refont pas la
+# comparaison. Les contrôles ne lisent ensuite que ces colonnes, sous leur
+# nom canonique.
+SCHEMA_ROWS = 10
+MIN_SIMILARITY = 0.85
+MAX_TEMPLATES = 128
+
+# Positions des colonnes Identifiant / Longitude / Latitude si la ligne
+# d'en-tête ne les nomme pas (modèle ANF)
+DEFAULT_DUPLICATE_POSITIONS = (0, 4, 5)
+
+_templates = OrderedDict()  # empreinte -> (nombre de noms reconnus, colonnes)
+_lock = threading.Lock()
+
+
+def _normalize(value):
+    # "  Tits  mécanques " -> "tits mecanques"
+    text = unicodedata.normalize('NFKD', str(value))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.lower().split())
+
+
+def _base(name):
+    # "Nombre d'antennes MIMO.1" -> "Nombre d'antennes MIMO" (suffixe pandas)
+    base, _, suffix = name.rpartition('.')
+    return base if suffix.isdigit() else name
+
+
+def _known_fields():
+    # Nom normalisé -> noms canoniques, dans l'ordre où les colonnes de ce
+    # nom se suivent dans la feuille (2G, 3G puis 4G)
+    fields = OrderedDict()
+    for gen in COLS.values():
+        for name in gen.values():
+            fields.setdefault(_normalize(_base(name)), []).append(name)
+    for name in DUPLICATE_FIELDS:
+        fields.setdefault(_normalize(name), []).append(name)
+    # Colonnes propres aux règles de doublons (les autres sont déjà connues)
+    for name in DUPLICATE_EXTRA:
+        if name not in fields.get(_normalize(_base(name)), []):
+            fields.setdefault(_normalize(name), []).append(name)
+    return fields
+
+
+KNOWN_FIELDS = _known_fields()
+
+
+def _match(cell):
+    # Nom connu le plus proche d'une cellule d'en-tête, ou None
+    if not isinstance(cell, str):
+        return None
+    text = _normalize(cell)
+    if text in KNOWN_FIELDS:
+        return text
+    best, score = None, MIN_SIMILARITY
+    for known in KNOWN_FIELDS:
+        matcher = SequenceMatcher(None, text, known)
+        if matcher.real_quick_ratio() < score or matcher.quick_ratio() < score:
+            continue
+        ratio = matcher.ratio()
+        if ratio >= score:
+            best, score = known, ratio
+    return best
+
+
+def fingerprint(row):
+    text = '\x1f'.join(_normalize(value) for value in row)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _columns(row):
+    # Nom canonique -> position, pour une ligne candidate
+    seen = {}
+    columns = {}
+    for position, cell in enumerate(row):
+        known = _match(cell)
+        if known is None:
+            continue
+        names = KNOWN_FIELDS[known]
+        rank = seen.get(known, 0)
+        seen[known] = rank + 1
+        if rank < len(names):
+            columns[names[rank]] = position
+    return len(columns), columns
+
+
+def _remember(key, template):
+    with _lock:
+        _templates[key] = template
+        _templates.move_to_end(key)
+        while len(_templates) > MAX_TEMPLATES:
+            _templates.popitem(last=False)
+
+
+def detect_schema(head):
+    # head : premières lignes brutes de la feuille (readers.read_head)
+    keys = [fingerprint(row) for row in head]
+    for header, key in enumerate(keys):
+        with _lock:
+            template = _templates.get(key)
+        if template is not None:
+            break
+    else:
+        candidates = [_columns(row) for row in head]
+        scores = [score for score, _ in candidates]
+        if not scores or max(scores) == 0:
+            header = min(HEADER_ROW, max(len(head) - 1, 0))
+            key = keys[header] if keys else fingerprint([])
+            template = (0, {})
+        else:
+            header = scores.index(max(scores))
+            key = keys[header]
+            template = candidates[header]
+            _remember(key, template)
+
+    columns = dict(template[1])
+    used = set(columns.values())
+    for name, position in zip(DUPLICATE_FIELDS, DEFAULT_DUPLICATE_POSITIONS):
+        if name not in columns and position not in used:
+            columns[name] = position
+    return {
+        'fingerprint': key,
+        'header': header,
+        'first_row': header + 2,  # n° de ligne Excel de la première ligne de données
+        'columns': columns
+    }
+
+
+def sheet_schema(source, sheet_name):
+    return detect_schema(read_head(source, sheet_name, SCHEMA_ROWS))
+
+
+def missing_columns(schema, names):
+    return [name for name in names if name not in schema['columns']]
+
+
+def read_columns(source, sheet_name, schema):
+    # Colonnes utiles seulement, renommées d'après le schéma
+    columns = schema['columns']
+    by_position = {position: name for name, position in columns.items()}
+    df = read_sheet(source, sheet_name, schema['header'], tuple(sorted(by_position)))
+    # Les positions au-delà de la dernière colonne de la feuille manquent
+    positions = sorted(by_position)[:len(df.columns)]
+    df.columns = [by_position[position] for position in positions]
+    return df
@@ -0,0 +1,86 @@
+import io
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from schema import sheet_schema, read_columns
+
+
+# ----------------------
+# SESSIONS D'ENVOI
+# ----------------------
+# /get_sheets garde le fichier en mémoire et renvoie un jeton : /process
+# réutilise les octets (et les feuilles déjà lues) sans nouvel envoi.
+# Éviction LRU bornée en nombre, en taille totale et en durée de vie.
+SESSION_TTL = 15 * 60  # secondes depuis la dernière utilisation
+MAX_SESSIONS = 16
+MAX_SESSION_BYTES = 256 * 1024 * 1024
+
+_sessions = OrderedDict()
+_lock = threading.Lock()
+
+
+def new_session(filename, data):
+    return {
+        'filename': filename,
+        'data': data,
+        'schemas': {},
+        'frames': {},
+        'size': len(data),
+        'last_used': time.monotonic()
+    }
+
+
+def store_session(session):
+    token = secrets.token_urlsafe(16)
+    with _lock:
+        _sessions[token] = session
+        _evict()
+    return token
+
+
+def get_session(token):
+    with _lock:
+        _evict()
+        session = _sessions.get(token)
+        if session is not None:
+            session['last_used'] = time.monotonic()
+            _sessions.move_to_end(token)
+        return session
+
+
+def _evict():
+    now = time.monotonic()
+    for token in [t for t, s in _sessions.items() if now - s['last_used'] > SESSION_TTL]:
+        del _sessions[token]
+
+    # La session la plus récente est toujours conservée
+    total = sum(s['size'] for s in _sessions.values())
+    while len(_sessions) > 1 and (len(_sessions) > MAX_SESSIONS or total > MAX_SESSION_BYTES):
+        _, session = _sessions.popitem(last=False)
+        total -= session['size']
+
+
+def session_source(session):
+    return io.BytesIO(session['data'])
+
+
+def session_schema(session, sheet_name):
+    schemas = session['schemas']
+    if sheet_name not in schemas:
+        schemas[sheet_name] = sheet_schema(session_source(session), sheet_name)
+    return schemas[sheet_name]
+
+
+def sheet_frame(session, sheet_name):
+    # Chaque feuille n'est lue qu'une fois par session, pour les deux
+    # contrôles : seulement les colonnes utiles (schema.py)
+    key = sheet_name
+    frames = session['frames']
+    if key not in frames:
+        frames[key] = read_columns(session_source(session), sheet_name, session_schema(session, sheet_name))
+        with _lock:
+            session['size'] += int(frames[key].memory_usage(index=True).sum())
+            _evict()
+    return frames[key]
@@ -0,0 +1,117 @@
+import numpy as np
+
+
+EARTH_RADIUS_M = 6371008.8
+
+# Décalages vers les 27 cellules voisines (la cellule elle-même comprise)
+_NEIGHBOURS = np.array([(dx, dy, dz)
+                        for dx in (-1, 0, 1)
+                        for dy in (-1, 0, 1)
+                        for dz in (-1, 0, 1)], dtype=np.int64)
+
+
+# ----------------------
+# INDEX SPATIAL PAR GRILLE
+# ----------------------
+# Les sites sont projetés sur la sphère (x, y, z en mètres) puis rangés
+# dans une grille de cubes de côté « rayon » : deux sites à moins d'un
+# rayon l'un de l'autre sont forcément dans des cellules voisines. Seules
+# ces paires candidates sont ensuite mesurées (haversine).
+def _to_xyz(lat, lon):
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    cos_lat = np.cos(lat)
+    return EARTH_RADIUS_M * np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+# Cellule (x, y, z) vue comme un seul élément, si l'étendue des cellules
+# dépasse 64 bits (rayon de quelques mètres sur toute la Terre)
+_CELL = np.dtype([('x', np.int64), ('y', np.int64), ('z', np.int64)])
+
+
+def _cell_coder(cells):
+    # Clé exacte (sans collision) d'une cellule : entier en base mixte sur
+    # l'étendue des cellules, avec une cellule de marge de chaque côté pour
+    # les voisines ; sinon élément (x, y, z), comparé champ par champ
+    low = cells.min(axis=0) - 1
+    widths = cells.max(axis=0) - low + 2
+    if int(widths[0]) * int(widths[1]) * int(widths[2]) >= 2 ** 63:
+        return lambda c: np.ascontiguousarray(c).view(_CELL).ravel()
+
+    def encode(c):
+        shifted = c - low
+        return (shifted[:, 0] * widths[1] + shifted[:, 1]) * widths[2] + shifted[:, 2]
+    return encode
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _pairs_between(starts_a, counts_a, starts_b, counts_b):
+    # Produit cartésien des points de chaque couple de cellules (a, b)
+    sizes = counts_a * counts_b
+    firsts = np.cumsum(sizes) - sizes
+    k = np.arange(sizes.sum()) - np.repeat(firsts, sizes)
+    width = np.repeat(counts_b, sizes)
+    return np.repeat(starts_a, sizes) + k // width, np.repeat(starts_b, sizes) + k % width
+
+
+def near_pairs(lat, lon, radius_m):
+    # Toutes les paires (i, j), i < j, à moins de radius_m mètres
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if lat.size < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    cells = np.floor(_to_xyz(lat, lon) / radius_m).astype(np.int64)
+    cell_keys = _cell_coder(cells)
+    keys = cell_keys(cells)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    bucket_keys, bucket_starts, bucket_counts = np.unique(sorted_keys, return_index=True, return_counts=True)
+    bucket_cells = cells[order[bucket_starts]]
+
+    left, right = [], []
+    for offset in _NEIGHBOURS:
+        neighbour_keys = cell_keys(bucket_cells + offset)
+        found = np.searchsorted(bucket_keys, neighbour_keys)
+        found = np.minimum(found, len(bucket_keys) - 1)
+        hit = np.flatnonzero(bucket_keys[found] == neighbour_keys)
+        a, b = _pairs_between(bucket_starts[hit], bucket_counts[hit],
+                              bucket_starts[found[hit]], bucket_counts[found[hit]])
+        i, j = order[a], order[b]
+        keep = i != j
+        left.append(np.minimum(i[keep], j[keep]))
+        right.append(np.maximum(i[keep], j[keep]))
+
+    i = np.concatenate(left)
+    j = np.concatenate(right)
+    # Une paire est vue depuis ses deux cellules
+    pair_ids = np.unique(i * lat.size + j)
+    i, j = pair_ids // lat.size, pair_ids % lat.size
+    close = haversine_m(lat[i], lon[i], lat[j], lon[j]) <= radius_m
+    return i[close], j[close]
+
+
+# ----------------------
+# REGROUPEMENT (union-find)
+# ----------------------
+def union_find(n, left, right):
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in zip(left.tolist(), right.tolist()):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+
+    return np.array([find(x) for x in range(n)], dtype=np.int64)
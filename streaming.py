@@ -0,0 +1,264 @@
+import math
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+from columnar import parse_numbers, parse_text
+from jobs import progress, found
+from readers import iter_rows
+from validation import (ERROR_FIELDS, DUPLICATE_FIELDS, DUPLICATE_EXTRA, COORDINATES, find_errors, duplicate_rules,
+                        duplicate_lines)
+from workbook import sheet_info
+
+
+# ----------------------
+# LECTURE PAR BLOCS (très gros classeurs)
+# ----------------------
+# La feuille est parcourue ligne à ligne (readers.iter_rows), CHUNK_ROWS lignes à la fois ;
+# chaque bloc est converti par le même analyseur que pd.read_excel
+# (TextParser), contrôlé, puis oublié. Seul l'état utile est conservé :
+# les lignes signalées et, pour les doublons, la première ligne vue pour
+# chaque coordonnée.
+#
+# pd.read_excel choisit le type d'une colonne sur la colonne entière (une
+# colonne de nombres devient float64 dès qu'une cellule est vide, et reste
+# en texte si une seule cellule n'est pas numérique). Un bloc ne voit qu'une
+# partie de la colonne : les valeurs renvoyées (Valeur, Identifiant,
+# Latitude, Longitude) sont donc corrigées à la fin, d'après _Kinds.
+CHUNK_ROWS = 5000
+
+
+def _is_nan(value):
+    return isinstance(value, float) and math.isnan(value)
+
+
+class _Kinds:
+    # Par colonne : toutes les valeurs sont-elles numériques (la colonne
+    # entière serait alors convertie) et en faut-il des flottants ?
+    def __init__(self, width):
+        self.numeric = [True] * width
+        self.floating = [False] * width
+
+    def update(self, chunk):
+        for i, dtype in enumerate(chunk.dtypes):
+            if dtype.kind not in 'iuf':
+                self.numeric[i] = False
+            elif dtype.kind == 'f':
+                self.floating[i] = True
+
+    def final(self, i, value, raw, chunk_numeric):
+        # Valeur telle que pd.read_excel l'aurait donnée sur toute la colonne
+        if self.numeric[i]:
+            if self.floating[i]:
+                return float(value)
+            return int(value)
+        if chunk_numeric:
+            # Colonne restée en texte : valeur d'origine (sauf cellule vide)
+            return np.nan if _is_nan(value) else raw
+        return value
+
+
+def iter_chunks(source, sheet_name, schema, names, chunk_rows=CHUNK_ROWS):
+    # Blocs (DataFrame, lignes brutes) indexés comme la feuille entière,
+    # réduits aux colonnes names (dans cet ordre) repérées par le schéma
+    columns = [name for name in names if name in schema['columns']]
+    positions = [schema['columns'][name] for name in columns]
+    header = schema['header']
+    width = len(columns)
+
+    source.seek(0)
+    source_rows = iter_rows(source, sheet_name)
+    try:
+        rows = []
+        blank = 0  # lignes vides en attente : ignorées si elles terminent la feuille
+        start = 0
+        for number, values in enumerate(source_rows):
+            if number <= header:
+                continue
+            values = [values[i] if i < len(values) else '' for i in positions]
+            if not any(value != '' for value in values):
+                blank += 1
+                continue
+            rows.extend([''] * width for _ in range(blank))
+            blank = 0
+            rows.append(values)
+
+            if len(rows) >= chunk_rows:
+                yield _frame(rows, columns, start), rows
+                start += len(rows)
+                rows = []
+        if rows:
+            yield _frame(rows, columns, start), rows
+    finally:
+        source_rows.close()
+
+
+def _frame(rows, columns, start):
+    chunk = TextParser(rows, names=list(columns), header=None).read()
+    chunk.index = pd.RangeIndex(start, start + len(rows))
+    return chunk
+
+
+# ----------------------
+# CONTRÔLES DE COHÉRENCE PAR BLOCS
+# ----------------------
+# Chaque contrôle reçoit les blocs l'un après l'autre (feed) puis rend son
+# résultat (result) : plusieurs contrôles partagent ainsi une seule lecture
+# de la feuille (stream_all).
+class _ErrorScan:
+    fields = ERROR_FIELDS
+
+    def __init__(self, schema, rules=None, timings=None):
+        self.first_row = schema['first_row']
+        self.rules = rules
+        self.timings = timings
+        self.kinds = None
+        self.pending = []  # (ligne signalée, n° de colonne, brute, bloc numérique)
+
+    def feed(self, chunk, rows):
+        if self.kinds is None:
+            self.kinds = _Kinds(len(chunk.columns))
+            self.positions = {name: i for i, name in enumerate(chunk.columns)}
+        self.kinds.update(chunk)
+
+        start = chunk.index[0]
+        lines = find_errors(chunk, self.first_row, self.rules, self.timings)
+        for line in lines:
+            i = self.positions[line["Colonne"]]
+            raw = rows[line["Ligne"] - self.first_row - start][i]
+            self.pending.append((line, i, raw, chunk.dtypes.iloc[i].kind in 'iuf'))
+        # Aperçu : Valeur telle que lue dans le bloc (corrigée en fin de feuille)
+        found('errors', lines)
+
+    def result(self):
+        error_lines = []
+        for line, i, raw, chunk_numeric in self.pending:
+            line["Valeur"] = self.kinds.final(i, line["Valeur"], raw, chunk_numeric)
+            error_lines.append(line)
+        return error_lines
+
+
+# ----------------------
+# DOUBLONS PAR BLOCS
+# ----------------------
+class _DuplicateScan:
+    # Pour chaque règle de doublons : première ligne vue par valeur de key,
+    # puis seulement les lignes dont la key est déjà vue (cellules brutes,
+    # coordonnées en nombres). Mode « proche » : toutes les lignes
+    # localisées en plus. En fin de feuille, les lignes retenues passent par
+    # validation.duplicate_lines : une key vue une seule fois ne peut former
+    # un groupe signalé, le résultat est celui de la feuille entière.
+    fields = DUPLICATE_FIELDS + DUPLICATE_EXTRA
+
+    def __init__(self, schema, radius=None):
+        self.first_row = schema['first_row']
+        self.radius = radius
+        self.rules, _ = duplicate_rules(schema['columns'])
+        self.kinds = None
+        self.coord_int = [True, True]  # Latitude / Longitude entières sur toute la colonne
+        self.first = [{} for _ in self.rules]
+        self.kept = {}  # position -> (position, valeurs, brutes, bloc numérique, latitude, longitude)
+
+    def _key(self, names, values, lat, lon):
+        # Valeur de key d'une ligne, None si une cellule est vide ; colonnes
+        # de valeurs : liste de nombres, comme validation._ragged_codes
+        key = []
+        for name in names:
+            if name in COORDINATES:
+                value = lat if name == 'Latitude' else lon
+            else:
+                value = values[self.columns[name]]
+                if name in ERROR_FIELDS and value != '':
+                    value = tuple(parse_text(str(value)) or ())
+            if value == '' or value == () or _is_nan(value):
+                return None
+            key.append(value)
+        return tuple(key)
+
+    def feed(self, chunk, rows):
+        if self.kinds is None:
+            self.kinds = _Kinds(len(chunk.columns))
+            self.columns = {name: i for i, name in enumerate(chunk.columns)}
+        self.kinds.update(chunk)
+        numeric = [dtype.kind in 'iuf' for dtype in chunk.dtypes]
+
+        latitude = parse_numbers(chunk['Latitude'])
+        longitude = parse_numbers(chunk['Longitude'])
+        self.coord_int = [self.coord_int[0] and latitude.dtype.kind in 'iu',
+                          self.coord_int[1] and longitude.dtype.kind in 'iu']
+
+        start = chunk.index[0]
+        values = chunk.to_numpy(dtype=object).tolist()
+        near = bool(self.radius)
+        for pos, lat, lon in zip(chunk.index.tolist(), latitude.tolist(), longitude.tolist()):
+            raw = rows[pos - start]
+            row = (pos, values[pos - start], raw, numeric, lat, lon)
+            if near and not (_is_nan(lat) or _is_nan(lon)):
+                self.kept[pos] = row
+            for rule, first in zip(self.rules, self.first):
+                if near and rule['key'] == COORDINATES:
+                    continue
+                key = self._key(rule['key'], raw, lat, lon)
+                if key is None:
+                    continue
+                if key in first:
+                    seen = first[key]
+                    if seen is not None:
+                        self.kept[seen[0]] = seen
+                        first[key] = None
+                    self.kept[pos] = row
+                else:
+                    first[key] = row
+
+    def result(self):
+        if not self.kept:
+            return []
+        kept = [self.kept[pos] for pos in sorted(self.kept)]
+        kinds, coord_int = self.kinds, self.coord_int
+        columns = {}
+        for name, i in self.columns.items():
+            if name in COORDINATES:
+                k = COORDINATES.index(name)
+                columns[name] = [int(row[4 + k]) if coord_int[k] and not _is_nan(row[4 + k]) else float(row[4 + k])
+                                 for row in kept]
+            else:
+                columns[name] = [kinds.final(i, row[1][i], row[2][i], row[3][i]) for row in kept]
+        df = pd.DataFrame(columns, index=[row[0] for row in kept])
+        lines = duplicate_lines(df, self.first_row, self.radius, self.rules)
+        found('doublons', lines)
+        return lines
+
+
+def _total(source, sheet_name, schema):
+    # Lignes de données d'après <dimension> (None si non déclarée)
+    for sheet in sheet_info(source):
+        if sheet['name'] == sheet_name and sheet['rows']:
+            return max(sheet['rows'] - schema['first_row'] + 1, 0)
+    return None
+
+
+def _scan(source, sheet_name, schema, scans, chunk_rows):
+    names = []
+    for scan in scans:
+        names += [name for name in scan.fields if name not in names]
+    progress(rows=0, rows_total=_total(source, sheet_name, schema))
+    for chunk, rows in iter_chunks(source, sheet_name, schema, names, chunk_rows):
+        for scan in scans:
+            scan.feed(chunk, rows)
+        progress(rows=int(chunk.index[-1]) + 1)
+    return [scan.result() for scan in scans]
+
+
+def stream_errors(source, sheet_name, schema, rules=None, timings=None, chunk_rows=CHUNK_ROWS):
+    return _scan(source, sheet_name, schema, [_ErrorScan(schema, rules, timings)], chunk_rows)[0]
+
+
+def stream_duplicates(source, sheet_name, schema, radius=None, chunk_rows=CHUNK_ROWS):
+    return _scan(source, sheet_name, schema, [_DuplicateScan(schema, radius)], chunk_rows)[0]
+
+
+def stream_all(source, sheet_name, schema, radius=None, rules=None, timings=None, chunk_rows=CHUNK_ROWS):
+    # Erreurs et doublons en une seule lecture
+    scans = [_ErrorScan(schema, rules, timings), _DuplicateScan(schema, radius)]
+    return _scan(source, sheet_name, schema, scans, chunk_rows)
@@ -0,0 +1,84 @@
+import io
+import os
+import sys
+import time
+
+import pytest
+from openpyxl import load_workbook
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from generate import SHEET_NAME, make_workbook  # noqa: E402
+
+
+# ----------------------
+# CLASSEURS DE TEST
+# ----------------------
+# Classeurs générés par benchmarks/generate.py, une fois par session : assez
+# d'erreurs de secteurs et de coordonnées répétées pour que chaque règle
+# trouve des lignes.
+@pytest.fixture(scope='session')
+def workbook(tmp_path_factory):
+    path = tmp_path_factory.mktemp('classeurs') / 'stations.xlsx'
+    return str(make_workbook(str(path), 3000, error_rate=0.05, duplicate_rate=0.05, seed=1))
+
+
+@pytest.fixture(scope='session')
+def workbook_data(workbook):
+    with open(workbook, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture(scope='session')
+def renamed_data(workbook, sheet_name):
+    # Mêmes sites, Identifiants changés (ST000001 -> NEWST000001)
+    wb = load_workbook(workbook)
+    for (cell,) in wb[sheet_name].iter_rows(min_row=3, max_col=1):
+        cell.value = 'NEW' + cell.value
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+@pytest.fixture(scope='session')
+def sheet_name():
+    return SHEET_NAME
+
+
+# ----------------------
+# APPLICATION
+# ----------------------
+# app.py écrit uploads/, results/, cache/ et les bases SQLite dans le
+# dossier courant : chaque test a le sien.
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import app
+    os.makedirs(app.UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(app.RESULT_FOLDER, exist_ok=True)
+    return app.app.test_client()
+
+
+def finish(client, response):
+    # Réponse finale d'un traitement (202 : attente sur /jobs/<id>)
+    body = response.get_json()
+    while response.status_code == 202 or body.get('state') in ('en_attente', 'en_cours'):
+        time.sleep(0.05)
+        response = client.get('/jobs/' + body['job'])
+        body = response.get_json()
+    return body
+
+
+@pytest.fixture
+def process(client, workbook_data, sheet_name):
+    # POST /process du classeur généré (sheet_name par défaut), résultat final
+    def run(action='detect_errors', data=None, **form):
+        form.setdefault('sheet_name', sheet_name)
+        if 'sheets' in form:
+            del form['sheet_name']
+        if 'token' not in form:
+            form['file'] = (io.BytesIO(workbook_data if data is None else data), 'stations.xlsx')
+        return finish(client, client.post('/process', data=dict(form, action=action)))
+    return run
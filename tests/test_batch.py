@@ -0,0 +1,30 @@
+import threading
+
+from batch import bounded_map
+
+
+# ----------------------
+# ORDRE DES RÉSULTATS
+# ----------------------
+def test_bounded_map_yields_in_completion_order():
+    # Le dernier élément finit seul ; chaque résultat reçu libère le
+    # précédent : l'ordre de fin est l'inverse de l'ordre d'envoi, et tous
+    # les éléments sont encore en cours quand items est épuisé
+    items = [0, 1, 2, 3]
+    release = {item: threading.Event() for item in items}
+    release[3].set()
+
+    def func(item):
+        assert release[item].wait(5)
+        if item == 2:
+            raise ValueError(item)
+        return item * 10
+
+    got = []
+    for item, result in bounded_map(func, items, workers=len(items)):
+        got.append((item, result))
+        if item > 0:
+            release[item - 1].set()
+    assert [item for item, _ in got] == [3, 2, 1, 0]
+    assert isinstance(got[1][1], ValueError)
+    assert [result for _, result in got if not isinstance(result, Exception)] == [30, 10, 0]
@@ -0,0 +1,92 @@
+import io
+import os
+import time
+
+import pytest
+
+import cache
+from cache import cache_key, cache_lookup, cache_stats, cache_store
+from sessions import new_session
+
+
+# ----------------------
+# CACHE DES RÉSULTATS (cache.py)
+# ----------------------
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'CACHE_FOLDER', str(tmp_path / 'cache'))
+    return tmp_path
+
+
+def _delta(before):
+    after = cache_stats()
+    return {name: after[name] - before[name] for name in after}
+
+
+def test_key_parts():
+    session = new_session('a.xlsx', b'contenu')
+    key = cache_key(session, 'F1', 'detect_errors', '5-x')
+    assert key == cache_key(new_session('b.xlsx', b'contenu'), 'F1', 'detect_errors', '5-x')
+    assert len({key,
+                cache_key(new_session('a.xlsx', b'autre'), 'F1', 'detect_errors', '5-x'),
+                cache_key(session, 'F2', 'detect_errors', '5-x'),
+                cache_key(session, 'F1', 'all', '5-x'),
+                cache_key(session, 'F1', 'detect_errors', '5-x', 100.0),
+                cache_key(session, 'F1', 'detect_errors', '6-x')}) == 6
+
+
+def test_store_then_lookup(folder):
+    workbook = folder / 'sortie.xlsx'
+    workbook.write_bytes(b'classeur')
+    copy = folder / 'copie.xlsx'
+    before = cache_stats()
+    assert cache_lookup('k', str(copy)) is None
+    cache_store('k', {'errors': [{'Ligne': 3}]}, str(workbook))
+    assert cache_lookup('k', str(copy)) == {'errors': [{'Ligne': 3}]}
+    assert copy.read_bytes() == b'classeur'
+    assert _delta(before) == {'hits': 1, 'misses': 1, 'stores': 1, 'evictions': 0}
+
+    # Sans classeur (aucune ligne signalée)
+    cache_store('vide', {'errors': []}, None)
+    assert cache_lookup('vide', str(folder / 'rien.xlsx')) == {'errors': []}
+    assert not (folder / 'rien.xlsx').exists()
+
+
+def test_eviction_by_age_then_size(folder, monkeypatch):
+    cache_store('ancienne', {'n': 1}, None)
+    path = os.path.join(cache.CACHE_FOLDER, 'ancienne.json')
+    os.utime(path, (0, 0))
+    cache_store('recente', {'n': 2}, None)
+    assert cache_lookup('ancienne', None) is None
+    assert cache_lookup('recente', None) == {'n': 2}
+
+    # Taille bornée : les entrées les moins récemment lues partent d'abord
+    path = os.path.join(cache.CACHE_FOLDER, 'recente.json')
+    monkeypatch.setattr(cache, 'CACHE_MAX_BYTES', 2 * os.path.getsize(path))
+    lue = time.time() - 60
+    os.utime(path, (lue, lue))
+    cache_store('autre', {'n': 3}, None)
+    cache_store('derniere', {'n': 4}, None)
+    assert cache_lookup('recente', None) is None
+    assert cache_lookup('autre', None) == {'n': 3}
+    assert cache_lookup('derniere', None) == {'n': 4}
+
+
+def test_process_served_from_cache(client, process, workbook_data, sheet_name):
+    before = cache_stats()
+    first = process('all')
+
+    # Même contenu sous un autre nom : réponse immédiate, classeur recopié
+    response = client.post('/process', data={'file': (io.BytesIO(workbook_data), 'copie.xlsx'), 'action': 'all',
+                                             'sheet_name': sheet_name})
+    assert response.status_code == 200
+    assert response.get_json()['results'] == first['results']
+    assert os.path.exists(os.path.join('results', response.get_json()['file']))
+    assert _delta(before) == {'hits': 1, 'misses': 1, 'stores': 1, 'evictions': 0}
+
+    # Autre action ou autre rayon : nouveau traitement
+    process('detect_errors')
+    process('all', mode='near', radius='50')
+    # Registre : la réponse dépend des envois précédents, pas de cache
+    process('all', registry='1')
+    assert _delta(before) == {'hits': 1, 'misses': 3, 'stores': 3, 'evictions': 0}
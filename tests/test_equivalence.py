@@ -0,0 +1,160 @@
+import io
+
+import pandas as pd
+import pytest
+
+import parallel
+from readers import READERS, read_sheet
+from schema import read_columns, sheet_schema
+from streaming import stream_duplicates, stream_errors
+from validation import DUPLICATES, HEADER_ROW, find_duplicates, find_errors
+
+
+# ----------------------
+# MOTEUR DE RÉFÉRENCE
+# ----------------------
+# Contrôles d'origine (boucle iterrows de app.py, groupby des coordonnées),
+# repris tels quels : le moteur vectorisé doit rendre les mêmes lignes, dans
+# le même ordre.
+BASELINE_COLS = {
+    '2G': {
+        'freq': "fréquences d'émission",
+        'tilt': "Tits mécanques et électriques de chaque antenne",
+        'pire': "Puissance isotrope rayonnée équivalente (PIRE) dans chaque secteur",
+        'ant': "Nombre d'antennes",
+        'azim': "azimut du rayonnement maximum dans chaque secteur"
+    },
+    '3G': {
+        'tilt': "Tits mécanques et électriques de chaque antenne.1",
+        'pire': "Puissance isotrope rayonnée équivalente (PIRE) dans chaque secteur.1",
+        'ant': "Nombre d'antennes MIMO",
+        'azim': "Azimut du rayonnement maximum dans chaque secteur"
+    },
+    '4G': {
+        'tilt': "Tits mécanques et électriques de chaque antenne.2",
+        'pire': "Puissance isotrope rayonnée équivalente (PIRE) dans chaque secteur.2",
+        'ant': "Nombre d'antennes MIMO.1",
+        'azim': "Azimut du rayonnement maximum dans chaque secteur.1"
+    }
+}
+
+
+def _baseline_values(value):
+    if pd.isna(value) or str(value).strip() in ['', 'nan']:
+        return None
+    try:
+        parts = str(value).replace(',', '.').split('/')
+        return [float(x.strip()) for x in parts if x.strip()]
+    except ValueError:
+        return None
+
+
+def baseline_errors(df, data_start_row=2):
+    cols = BASELINE_COLS
+    error_lines = []
+    for idx, row in df.iterrows():
+        freq_2g = _baseline_values(row[cols['2G']['freq']])
+        if not freq_2g:
+            continue
+        ref_count = len(freq_2g)
+        ref_azim = _baseline_values(row[cols['2G']['azim']])
+        for gen in ['2G', '3G', '4G']:
+            for field in ['tilt', 'pire', 'ant']:
+                val = _baseline_values(row[cols[gen][field]])
+                if val and len(val) != ref_count:
+                    error_lines.append({
+                        "Ligne": idx + data_start_row + 1,
+                        "Colonne": cols[gen][field],
+                        "Valeur": row[cols[gen][field]],
+                        "Problème": f"{gen} - {field}: {len(val)} ≠ {ref_count}"
+                    })
+            azim = _baseline_values(row[cols[gen]['azim']])
+            if azim and ref_azim and azim != ref_azim:
+                error_lines.append({
+                    "Ligne": idx + data_start_row + 1,
+                    "Colonne": cols[gen]['azim'],
+                    "Valeur": row[cols[gen]['azim']],
+                    "Problème": f"{gen} - azimut ≠ 2G"
+                })
+    return error_lines
+
+
+def baseline_duplicates(df, first_row):
+    # Mêmes coordonnées, identifiants différents
+    df = df.assign(Latitude=pd.to_numeric(df['Latitude'], errors='coerce'),
+                   Longitude=pd.to_numeric(df['Longitude'], errors='coerce'))
+    df_coords = df.dropna(subset=['Latitude', 'Longitude'])
+    groupes = df_coords.groupby(['Latitude', 'Longitude'])['Identifiant'].agg(['count', 'nunique'])
+    lignes = []
+    for (lat, lon), _ in groupes[groupes['nunique'] > 1].iterrows():
+        mask = (df_coords['Latitude'] == lat) & (df_coords['Longitude'] == lon)
+        lignes.extend(df_coords[mask].index.tolist())
+    return [(idx + first_row, df.at[idx, 'Identifiant'], df.at[idx, 'Latitude'], df.at[idx, 'Longitude'])
+            for idx in lignes]
+
+
+def _read(data, sheet_name):
+    schema = sheet_schema(io.BytesIO(data), sheet_name)
+    return schema, read_columns(io.BytesIO(data), sheet_name, schema)
+
+
+# ----------------------
+# ÉQUIVALENCES
+# ----------------------
+def test_errors_match_baseline(workbook, sheet_name):
+    # Feuille entière lue comme à l'origine
+    df = pd.read_excel(workbook, sheet_name=sheet_name, header=HEADER_ROW)
+    df.columns = [str(col).strip() for col in df.columns]
+    expected = baseline_errors(df)
+    assert expected
+    assert find_errors(df) == expected
+
+
+def test_schema_columns_match_baseline(workbook, workbook_data, sheet_name):
+    # Colonnes utiles seulement (schema.py), lignes numérotées d'après l'en-tête trouvé
+    df = pd.read_excel(workbook, sheet_name=sheet_name, header=HEADER_ROW)
+    df.columns = [str(col).strip() for col in df.columns]
+    schema, columns = _read(workbook_data, sheet_name)
+    assert find_errors(columns, schema['first_row']) == baseline_errors(df)
+
+
+def test_duplicates_match_baseline(workbook_data, sheet_name):
+    schema, df = _read(workbook_data, sheet_name)
+    expected = baseline_duplicates(df, schema['first_row'])
+    assert expected
+    label = DUPLICATES[0]['label']
+    got = [(line['Ligne'], line['Identifiant'], line['Latitude'], line['Longitude'])
+           for line in find_duplicates(df, schema['first_row']) if line['Règle'] == label]
+    assert got == expected
+
+
+@pytest.mark.parametrize('reader', sorted(READERS))
+def test_readers_match(workbook_data, sheet_name, reader):
+    schema = sheet_schema(io.BytesIO(workbook_data), sheet_name)
+    usecols = tuple(sorted(schema['columns'].values()))
+    expected = read_sheet(io.BytesIO(workbook_data), sheet_name, schema['header'], usecols, reader='openpyxl')
+    got = read_sheet(io.BytesIO(workbook_data), sheet_name, schema['header'], usecols, reader=reader)
+    pd.testing.assert_frame_equal(got, expected)
+
+
+def test_streaming_matches_memory(workbook_data, sheet_name):
+    schema, df = _read(workbook_data, sheet_name)
+    errors = stream_errors(io.BytesIO(workbook_data), sheet_name, schema, chunk_rows=500)
+    assert errors == find_errors(df, schema['first_row'])
+    doublons = stream_duplicates(io.BytesIO(workbook_data), sheet_name, schema, chunk_rows=500)
+    assert doublons == find_duplicates(df, schema['first_row'])
+
+
+def test_parallel_matches_serial(workbook_data, sheet_name, monkeypatch):
+    # Plages de lignes réparties sur deux processus, même pour une petite feuille
+    schema, df = _read(workbook_data, sheet_name)
+    monkeypatch.setattr(parallel, 'PROCESS_WORKERS', 2)
+    monkeypatch.setattr(parallel, 'PARALLEL_MIN_ROWS', 0)
+    monkeypatch.setattr(parallel, 'PARALLEL_CHUNK_ROWS', 1000)
+    monkeypatch.setattr(parallel, '_pool', None)
+    try:
+        got = parallel.find_errors_parallel(df, schema['first_row'])
+    finally:
+        if parallel._pool is not None:
+            parallel._pool.shutdown()
+    assert got == find_errors(df, schema['first_row'])
@@ -0,0 +1,68 @@
+import io
+import threading
+
+import pytest
+
+import history
+from rules import select_rules
+from schema import read_columns, sheet_schema
+from validation import find_errors
+
+
+# ----------------------
+# REVALIDATION INCRÉMENTALE (history.py)
+# ----------------------
+@pytest.fixture
+def sheet(workbook_data, sheet_name, tmp_path, monkeypatch):
+    monkeypatch.setattr(history, 'HISTORY_PATH', str(tmp_path / 'history.sqlite3'))
+    schema = sheet_schema(io.BytesIO(workbook_data), sheet_name)
+    return read_columns(io.BytesIO(workbook_data), sheet_name, schema), schema['first_row']
+
+
+def _run(df, first_row):
+    stats = {}
+    lines = history.find_errors_incremental(df, first_row, select_rules(), stats=stats)
+    return lines, stats
+
+
+def test_rows_reused_then_recomputed(sheet):
+    df, first_row = sheet
+    expected = find_errors(df, first_row)
+    assert _run(df, first_row) == (expected, {'reused': 0, 'recomputed': len(df)})
+    assert _run(df, first_row) == (expected, {'reused': len(df), 'recomputed': 0})
+
+    # Deux lignes modifiées : seules celles-ci sont recontrôlées
+    freq = "fréquences d'émission"
+    changed = df.copy()
+    changed.loc[[3, 10], freq] = '900/1800/900/1800'
+    lines, stats = _run(changed, first_row)
+    assert stats == {'reused': len(df) - 2, 'recomputed': 2}
+    assert lines == find_errors(changed, first_row)
+
+
+def test_concurrent_runs_keep_each_other_rows(sheet, monkeypatch):
+    # Deux traitements en même temps sur la même base, feuilles sans ligne
+    # commune : chacun doit retrouver toutes ses lignes au passage suivant
+    df, first_row = sheet
+    halves = [df.iloc[:len(df) // 2], df.iloc[len(df) // 2:]]
+    barrier = threading.Barrier(2)
+    evaluate = history.evaluate_rules
+
+    def overlapping(*args):
+        # Les deux contrôles se chevauchent, sauf si le premier tient la base
+        try:
+            barrier.wait(timeout=1)
+        except threading.BrokenBarrierError:
+            pass
+        return evaluate(*args)
+
+    monkeypatch.setattr(history, 'evaluate_rules', overlapping)
+    threads = [threading.Thread(target=_run, args=(half, first_row)) for half in halves]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    monkeypatch.setattr(history, 'evaluate_rules', evaluate)
+
+    for half in halves:
+        assert _run(half, first_row)[1] == {'reused': len(half), 'recomputed': 0}
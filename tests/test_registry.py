@@ -0,0 +1,78 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import registry
+from registry import find_registered, register_sites
+
+
+# ----------------------
+# REGISTRE DES SITES (registry.py)
+# ----------------------
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    path = str(tmp_path / 'registry.sqlite3')
+    monkeypatch.setattr(registry, 'REGISTRY_PATH', path)
+    return path
+
+
+def _sites(path):
+    try:
+        with sqlite3.connect(path) as db:
+            return db.execute('SELECT COUNT(*) FROM sites').fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def _frame(ids, coords):
+    return pd.DataFrame({'Identifiant': ids, 'Longitude': [lon for _, lon in coords],
+                         'Latitude': [lat for lat, _ in coords]})
+
+
+def test_find_then_register(store):
+    coords = [(36.75, 3.05), (35.7, -0.63), (-33.9, 18.4)]
+    first = _frame(['ST1', 'ST2', 'ST3'], coords)
+    assert find_registered(first, 4) == []
+    assert _sites(store) == 0  # la recherche ne fait que lire
+    register_sites(first, 'q1.xlsx / F')
+    assert _sites(store) == 3
+
+    # Même Identifiant : déclaration actuelle, pas un doublon
+    assert find_registered(first, 4) == []
+    # Nouvel Identifiant aux coordonnées d'un site enregistré, ou à 30 m
+    moved = [(36.75, 3.05), (35.7 + 30 / 111195, -0.63), (0.0, 0.0)]
+    second = _frame(['NEW1', 'NEW2', 'NEW3'], moved)
+    assert [(line['Ligne'], line['Identifiant connu']) for line in find_registered(second, 4)] == [(4, 'ST1')]
+    near = find_registered(second, 4, 50)
+    assert [(line['Ligne'], line['Identifiant connu'], line['Source']) for line in near] == [
+        (4, 'ST1', 'q1.xlsx / F'), (5, 'ST2', 'q1.xlsx / F')]
+    assert near[1]['Distance (m)'] == pytest.approx(30, abs=0.5)
+
+
+def test_registered_only_after_success(client, process, renamed_data, monkeypatch):
+    import app  # après le changement de dossier (client)
+
+    path = registry.REGISTRY_PATH  # relatif au dossier du test
+    write = app.write_highlighted
+
+    def full_disk(*args, **kwargs):
+        raise OSError('disque plein')
+
+    # Échec après les contrôles : rien n'est enregistré
+    monkeypatch.setattr(app, 'write_highlighted', full_disk)
+    failed = process('detect_duplicates', registry='1')
+    assert failed['state'] == 'echec' and failed['error'] == 'disque plein'
+    assert _sites(path) == 0
+
+    monkeypatch.setattr(app, 'write_highlighted', write)
+    done = process('detect_duplicates', registry='1')
+    assert done['results']['registre'] == []
+    registered = _sites(path)
+    assert registered > 0
+
+    # Les mêmes sites sous d'autres Identifiants : retrouvés, chaque ligne
+    # au moins avec son ancien site
+    renamed = process('detect_duplicates', data=renamed_data, registry='1')['results']['registre']
+    own = {line['Ligne'] for line in renamed if line['Identifiant'] == 'NEW' + line['Identifiant connu']}
+    assert len(own) == len({line['Ligne'] for line in renamed}) == registered
@@ -0,0 +1,81 @@
+import pytest
+
+from findings import COLUMN_FIELDS
+
+
+# ----------------------
+# LECTURE PAGINÉE DES RÉSULTATS (/results/<id>)
+# ----------------------
+@pytest.fixture
+def job(process):
+    body = process('all')
+    return body['job'], body['results']
+
+
+def _pages(client, job_id, **args):
+    lines, cursor = [], None
+    while True:
+        query = dict(args, cursor=cursor) if cursor else args
+        page = client.get(f'/results/{job_id}', query_string=query).get_json()
+        lines += page['lines']
+        cursor = page['next']
+        if cursor is None:
+            return page, lines
+
+
+def test_pages_cover_all_lines(client, job):
+    job_id, results = job
+    page, lines = _pages(client, job_id, kind='errors', limit=70)
+    assert lines == results['errors']
+    assert page['total'] == page['matched'] == len(results['errors'])
+    page, lines = _pages(client, job_id, kind='doublons', limit=1000)
+    assert lines == results['doublons']
+    assert page['summary']['rules'] == {line['Règle']: sum(x['Règle'] == line['Règle'] for x in lines)
+                                        for line in lines}
+
+
+def test_filters(client, job):
+    job_id, results = job
+    _, lines = _pages(client, job_id, kind='errors', generation='3G,4G', field='tilt')
+    assert lines == [line for line in results['errors']
+                     if COLUMN_FIELDS[line['Colonne']] in (('3G', 'tilt'), ('4G', 'tilt'))]
+    assert lines
+
+    column = results['errors'][0]['Colonne']
+    page, lines = _pages(client, job_id, kind='errors', column=column, row_min=100, row_max=2000)
+    assert lines == [line for line in results['errors'] if line['Colonne'] == column and 100 <= line['Ligne'] <= 2000]
+    assert page['matched'] == len(lines) and page['total'] == len(results['errors'])
+
+
+def test_sort(client, job):
+    job_id, results = job
+    _, lines = _pages(client, job_id, kind='doublons', sort='-Ligne', limit=1000)
+    assert [line['Ligne'] for line in lines] == sorted((line['Ligne'] for line in results['doublons']), reverse=True)
+
+
+def test_sheet_filter(client, process, sheet_name):
+    body = process('detect_errors', sheets='*')
+    _, lines = _pages(client, body['job'], sheet=sheet_name, limit=1000)
+    assert lines == body['results']['errors']
+    page = client.get(f"/results/{body['job']}", query_string={'sheet': 'Autre'}).get_json()
+    assert page['matched'] == 0 and page['lines'] == [] and page['next'] is None
+
+
+def test_counts_without_lines(client, job):
+    job_id, results = job
+    status = client.get(f'/jobs/{job_id}', query_string={'lines': '0'}).get_json()
+    assert 'errors' not in status['results']
+    assert status['summary']['errors']['total'] == len(results['errors'])
+    assert status['summary']['doublons']['total'] == len(results['doublons'])
+
+
+@pytest.mark.parametrize('query', [{'kind': 'autre'}, {'cursor': '-1'}, {'limit': 'x'}, {'generation': '5G'},
+                                   {'field': 'couleur'}, {'sort': 'Inconnue'}, {'kind': 'registre'}])
+def test_invalid_queries(client, job, query):
+    response = client.get(f'/results/{job[0]}', query_string=query)
+    assert response.status_code == 400
+    assert response.get_json()['error']
+
+
+def test_unknown_job(client):
+    assert client.get('/results/inconnu').status_code == 404
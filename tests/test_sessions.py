@@ -0,0 +1,61 @@
+import io
+from collections import OrderedDict
+
+import pytest
+
+import sessions
+from sessions import SESSION_TTL, get_session, new_session, sheet_frame, store_session
+
+
+# ----------------------
+# SESSIONS D'ENVOI (sessions.py)
+# ----------------------
+@pytest.fixture(autouse=True)
+def empty(monkeypatch):
+    monkeypatch.setattr(sessions, '_sessions', OrderedDict())
+
+
+def test_expired_session_dropped():
+    token = store_session(new_session('a.xlsx', b'a'))
+    session = get_session(token)
+    assert session is not None
+    session['last_used'] -= SESSION_TTL + 1
+    assert get_session(token) is None
+
+
+def test_least_recently_used_evicted(monkeypatch):
+    monkeypatch.setattr(sessions, 'MAX_SESSIONS', 2)
+    first = store_session(new_session('a.xlsx', b'a'))
+    second = store_session(new_session('b.xlsx', b'b'))
+    assert get_session(first) is not None  # second devient la plus ancienne
+    third = store_session(new_session('c.xlsx', b'c'))
+    assert get_session(second) is None
+    assert get_session(first) is not None and get_session(third) is not None
+
+
+def test_size_bound_keeps_latest(monkeypatch):
+    monkeypatch.setattr(sessions, 'MAX_SESSION_BYTES', 10)
+    first = store_session(new_session('a.xlsx', b'x' * 8))
+    second = store_session(new_session('b.xlsx', b'x' * 20))
+    assert get_session(first) is None
+    assert get_session(second) is not None
+
+
+def test_sheet_read_once(workbook_data, sheet_name):
+    session = new_session('stations.xlsx', workbook_data)
+    df = sheet_frame(session, sheet_name)
+    assert session['size'] > len(workbook_data)
+    assert sheet_frame(session, sheet_name) is df
+
+
+def test_process_with_token(client, process, workbook_data, sheet_name):
+    response = client.post('/get_sheets', data={'file': (io.BytesIO(workbook_data), 'stations.xlsx')})
+    body = response.get_json()
+    assert body['sheets'] == [sheet_name]
+    assert process('detect_errors', token=body['token'])['results']['errors']
+
+    # Session expirée : le fichier doit être renvoyé
+    sessions._sessions[body['token']]['last_used'] -= SESSION_TTL + 1
+    response = client.post('/process', data={'token': body['token'], 'action': 'detect_errors',
+                                             'sheet_name': sheet_name})
+    assert response.status_code == 410
@@ -0,0 +1,44 @@
+from openpyxl import load_workbook
+
+
+# ----------------------
+# PLUSIEURS FEUILLES (/process sheets=...)
+# ----------------------
+def test_sheets_not_served_from_single_sheet_cache(process, sheet_name):
+    # Même classeur, même feuille : la réponse d'une seule feuille est en
+    # cache, la requête par feuilles ne doit pas la reprendre
+    single = process('detect_errors')
+    assert 'sheets' not in single['results']
+    cached = process('detect_errors')
+    assert cached['results'] == single['results']
+
+    several = process('detect_errors', sheets=sheet_name)
+    assert several['results']['sheets'] == [{'Feuille': sheet_name, 'errors': len(single['results']['errors'])}]
+    assert all(line['Feuille'] == sheet_name for line in several['results']['errors'])
+
+
+def test_sheets_workbook(client, process, sheet_name):
+    body = process('all', sheets='*')
+    results = body['results']
+    assert [sheet['Feuille'] for sheet in results['sheets']] == [sheet_name]
+    assert results['errors'] and results['doublons']
+    wb = load_workbook(f"results/{body['file']}", read_only=True)
+    assert wb.sheetnames == [sheet_name, 'Erreurs', 'Doublons']
+
+
+def test_sheets_registry_and_incremental(process, renamed_data, sheet_name):
+    first = process('all', sheets='*', registry='1', incremental='1')['results']
+    rows = first['incremental']['recomputed']
+    assert first['incremental'] == {'reused': 0, 'recomputed': rows} and rows > 0
+    assert first['registre'] == []
+
+    again = process('all', sheets='*', registry='1', incremental='1')['results']
+    assert again['incremental'] == {'reused': rows, 'recomputed': 0}
+    assert again['sheets'][0]['incremental'] == again['incremental']
+    assert again['errors'] == first['errors']
+
+    # Sites enregistrés par les traitements réussis, retrouvés sous leurs
+    # nouveaux Identifiants
+    renamed = process('detect_duplicates', data=renamed_data, sheets='*', registry='1')['results']
+    assert renamed['registre'] and all(line['Feuille'] == sheet_name for line in renamed['registre'])
+    assert renamed['sheets'][0]['registre'] == len(renamed['registre'])
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from spatial import EARTH_RADIUS_M, haversine_m, near_pairs
+from validation import DUPLICATES, find_near_duplicates
+
+
+# ----------------------
+# MODE « PROCHE » (spatial.py)
+# ----------------------
+# Comparaison à toutes les paires mesurées une à une (O(n²)), sur des points
+# autour de (0, 0) (bords de cellules x / y / z, coordonnées négatives),
+# de l'antiméridien, d'un pôle, et des paires juste sous / juste au-delà
+# du rayon.
+_DEGREE_M = EARTH_RADIUS_M * np.pi / 180
+
+
+def _points(radius, seed=0):
+    rnd = np.random.default_rng(seed)
+    spread = 4 * radius / _DEGREE_M
+    centres = [(0.0, 0.0), (-33.45, -70.66), (12.5, 179.9999), (-12.5, -179.9999), (89.9999, 45.0), (36.7, 3.05)]
+    lat, lon = [], []
+    for clat, clon in centres:
+        lat.append(clat + rnd.uniform(-spread, spread, 250))
+        lon.append(clon + rnd.uniform(-spread, spread, 250))
+    # Sur les bords : équateur, méridien d'origine, antiméridien
+    edge = rnd.uniform(-spread, spread, 40)
+    lat += [np.zeros(40), edge, edge, np.zeros(3)]
+    lon += [edge, np.zeros(40), np.full(40, 180.0), np.array([0.0, 180.0, -180.0])]
+    lat, lon = np.concatenate(lat), np.concatenate(lon)
+    # Paires à 0,999999 et 1,000001 rayon, le long d'un méridien
+    base = rnd.integers(0, lat.size, 60)
+    step = radius / _DEGREE_M * np.repeat([0.999999, 1.000001], 30)
+    return np.concatenate([lat, np.clip(lat[base] - step, -90, 90)]), np.concatenate([lon, lon[base]])
+
+
+def _brute_pairs(lat, lon, radius):
+    i, j = np.triu_indices(lat.size, k=1)
+    close = haversine_m(lat[i], lon[i], lat[j], lon[j]) <= radius
+    return set(zip(i[close].tolist(), j[close].tolist()))
+
+
+# Rayon qui divise exactement le rayon terrestre : (0, 0) tombe sur un
+# bord ; 1 m sur des points de toute la Terre : clé de cellule au-delà de
+# 64 bits (spatial._cell_coder)
+RADII = [100.0, EARTH_RADIUS_M / 63710, 2500.0, 1.0]
+
+
+@pytest.mark.parametrize('radius', RADII)
+def test_near_pairs_match_brute_force(radius):
+    lat, lon = _points(radius)
+    i, j = near_pairs(lat, lon, radius)
+    expected = _brute_pairs(lat, lon, radius)
+    assert len(expected) > 100
+    assert set(zip(i.tolist(), j.tolist())) == expected
+    assert len(i) == len(expected)
+
+
+@pytest.mark.parametrize('radius', RADII)
+def test_near_duplicates_match_brute_force(radius):
+    lat, lon = _points(radius, seed=1)
+    rnd = np.random.default_rng(2)
+    ids = rnd.choice(['A', 'B', 'C', 'D', 'E', 'F', None], lat.size, p=[0.3, 0.2, 0.2, 0.1, 0.1, 0.05, 0.05])
+    lat[rnd.integers(0, lat.size, 20)] = np.nan
+    df = pd.DataFrame({'Identifiant': ids, 'Longitude': lon, 'Latitude': lat})
+
+    # Sites reliés de proche en proche, groupes à plusieurs Identifiants
+    located = np.flatnonzero(~np.isnan(lat))
+    parent = {int(k): int(k) for k in located}
+
+    def root(k):
+        while parent[k] != k:
+            k = parent[k]
+        return k
+    for a, b in _brute_pairs(lat[located], lon[located], radius):
+        ra, rb = root(int(located[a])), root(int(located[b]))
+        parent[max(ra, rb)] = min(ra, rb)
+    groups = {}
+    for k in parent:
+        groups.setdefault(root(k), []).append(k)
+    expected = {frozenset(rows) for rows in groups.values()
+                if len({ids[k] for k in rows if ids[k] is not None}) > 1}
+    assert expected
+
+    label = DUPLICATES[0]['label']
+    found = {}
+    for line in find_near_duplicates(df, radius, first_row=0):
+        if line['Règle'] == label:
+            found.setdefault(line['Groupe'], set()).add(line['Ligne'])
+    assert {frozenset(rows) for rows in found.values()} == expected
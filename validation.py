@@ -0,0 +1,253 @@
+import numpy as np
+import pandas as pd
+
+from columnar import encode_ragged, parse_numbers
+from rules import COLUMNS, DUPLICATE_RULES, select_rules, evaluate_rules
+from spatial import near_pairs, union_find
+
+
+# À incrémenter à chaque changement des contrôles : invalide le cache des
+# résultats (cache.py)
+ENGINE_VERSION = '5'
+
+# Modèle ANF : en-tête sur la 2e ligne, données à partir de la 3e (la ligne
+# d'en-tête réelle est retrouvée par schema.py)
+HEADER_ROW = 1
+DATA_START_ROW = 2
+
+# Colonnes par génération : définies avec les règles (rules.yaml)
+COLS = COLUMNS
+
+ERROR_FIELDS = [name for gen in COLS.values() for name in gen.values()]
+
+# Règles de doublons actives (rules.yaml). Seules Identifiant / Longitude /
+# Latitude sont requises ; les autres colonnes des règles (DUPLICATE_EXTRA)
+# sont lues si la feuille les a, une règle dont une colonne manque est
+# ignorée (duplicate_rules).
+DUPLICATES = [rule for rule in DUPLICATE_RULES if rule['enabled']]
+COORDINATES = ['Latitude', 'Longitude']
+DUPLICATE_FIELDS = ['Identifiant', 'Longitude', 'Latitude']
+DUPLICATE_EXTRA = []
+for _rule in DUPLICATES:
+    for _name in _rule['key'] + _rule['distinct']:
+        if _name not in DUPLICATE_FIELDS and _name not in DUPLICATE_EXTRA:
+            DUPLICATE_EXTRA.append(_name)
+
+
+# ----------------------
+# CONTRÔLES DE COHÉRENCE (colonne par colonne)
+# ----------------------
+def find_errors(df, first_row=DATA_START_ROW + 1, rules=None, timings=None):
+    # Chaque règle est évaluée sur des colonnes entières (rules.py), chaque
+    # colonne n'étant découpée qu'une fois. first_row : n° de ligne Excel
+    # de la première ligne de df. rules : règles retenues (par défaut celles
+    # actives dans rules.yaml).
+    if rules is None:
+        rules = select_rules()
+    checks = evaluate_rules(df, rules, timings)
+    return error_lines(df, first_row, rules, *error_hits(checks))
+
+
+def error_hits(checks):
+    # Erreurs dans l'ordre où une ligne est contrôlée (ligne, puis règle) :
+    # positions dans df, n° de la règle, message
+    if not checks:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), []
+    rows = [np.flatnonzero(mask) for _, mask, _ in checks]
+    order = [np.full(hits.size, k) for k, hits in enumerate(rows)]
+    rows = np.concatenate(rows)
+    order = np.concatenate(order)
+    sort = np.lexsort((order, rows))
+    rows, order = rows[sort], order[sort]
+
+    fields = {}
+    messages = []
+    for pos, k in zip(rows.tolist(), order.tolist()):
+        rule = checks[k][0]
+        if k not in fields:
+            fields[k] = {name: values.tolist() for name, values in checks[k][2].items()}
+        values = {name: column[pos] for name, column in fields[k].items()}
+        messages.append(rule['message'].format(min=rule['min'], max=rule['max'], **values))
+    return rows, order, messages
+
+
+def error_lines(df, first_row, rules, rows, order, messages):
+    # Lignes du rapport ; « Valeur » : cellule d'origine, lue dans df (seules
+    # les lignes en erreur sont lues, règle par règle)
+    index = df.index[rows].tolist()
+    raw = [None] * len(rows)
+    for k in np.unique(order).tolist():
+        at = np.flatnonzero(order == k)
+        for i, value in zip(at.tolist(), df[rules[k]['column']].take(rows[at]).tolist()):
+            raw[i] = value
+    return [{
+        "Ligne": line + first_row,
+        "Colonne": rules[k]['column'],
+        "Valeur": value,
+        "Problème": message
+    } for line, k, value, message in zip(index, order.tolist(), raw, messages)]
+
+
+# ----------------------
+# DOUBLONS
+# ----------------------
+def duplicate_rules(columns, rules=None):
+    # (règles applicables, règles ignorées) d'après les colonnes de la
+    # feuille ; ignorée : {'Règle': libellé, 'Colonnes': colonnes absentes}
+    rules = DUPLICATES if rules is None else rules
+    applied, skipped = [], []
+    for rule in rules:
+        missing = [name for name in dict.fromkeys(rule['key'] + rule['distinct']) if name not in columns]
+        if missing:
+            skipped.append({'Règle': rule['label'], 'Colonnes': missing})
+        else:
+            applied.append(rule)
+    return applied, skipped
+
+
+def _coordonnees(df):
+    # df : colonnes Identifiant / Longitude / Latitude (schema.read_columns),
+    # et celles des règles de doublons présentes dans la feuille
+    df = df[[name for name in DUPLICATE_FIELDS + DUPLICATE_EXTRA if name in df.columns]].assign(
+        Latitude=parse_numbers(df['Latitude']),
+        Longitude=parse_numbers(df['Longitude'])
+    )
+    return df, df.dropna(subset=['Latitude', 'Longitude'])
+
+
+def _dense(codes):
+    # Codes renumérotés 0..n-1 dans le même ordre (-1 inchangé), et n
+    dense = np.full(codes.size, -1, dtype=np.int64)
+    valid = codes >= 0
+    dense[valid], values = pd.factorize(codes[valid], sort=True)
+    return dense, values.size
+
+
+def _ragged_codes(series, sort):
+    # Colonne de valeurs ("900/1800") codée sur les listes de nombres et
+    # non sur le texte : "900 / 1800", "900,0" et 900 ont le même code ;
+    # cellule vide ou illisible : -1
+    col = encode_ragged(series)
+    bounds = col.offsets.tolist()
+    entries = [tuple(col.values[a:b].tolist()) for a, b in zip(bounds[:-1], bounds[1:])]
+    distinct = dict.fromkeys(entry for entry in entries if entry)
+    if sort:
+        distinct = sorted(distinct)
+    number = {entry: k for k, entry in enumerate(distinct)}
+    remap = np.array([number.get(entry, -1) for entry in entries], dtype=np.int64)
+    return remap[col.codes], len(number)
+
+
+class _Codes:
+    # Colonnes codées une seule fois pour toutes les règles (pd.factorize,
+    # -1 si vide ; colonnes de valeurs par génération : listes de nombres,
+    # _ragged_codes), puis combinaisons de colonnes. Les colonnes d'une key
+    # sont codées dans l'ordre des valeurs triées : les groupes sortent dans
+    # cet ordre. radius_m : key [Latitude, Longitude] regroupée de proche en
+    # proche.
+    def __init__(self, df, rules, radius_m=None):
+        self.df = df
+        self.radius_m = radius_m
+        self.sorted = {name for rule in rules for name in rule['key']}
+        self.columns = {}
+        self.combined = {}
+
+    def column(self, name):
+        if name not in self.columns:
+            if name in ERROR_FIELDS:
+                self.columns[name] = _ragged_codes(self.df[name], name in self.sorted)
+            else:
+                codes, uniques = pd.factorize(self.df[name], sort=name in self.sorted)
+                self.columns[name] = codes.astype(np.int64), len(uniques)
+        return self.columns[name]
+
+    def codes(self, names, key=False):
+        near = key and bool(self.radius_m) and names == COORDINATES
+        entry = (tuple(names), near)
+        if entry not in self.combined:
+            self.combined[entry] = self._near() if near else self._combine(names)
+        return self.combined[entry]
+
+    def _combine(self, names):
+        # Ordre des valeurs de la première colonne, puis des suivantes
+        codes, size = self.column(names[0])
+        for name in names[1:]:
+            more, n = self.column(name)
+            codes = np.where((codes < 0) | (more < 0), -1, codes * n + more)
+            codes, size = _dense(codes)
+        return codes, size
+
+    def _near(self):
+        # Sites à moins de radius_m mètres : chaque groupe est numéroté par
+        # sa première ligne
+        codes = np.full(len(self.df), -1, dtype=np.int64)
+        located = np.flatnonzero(self.df['Latitude'].notna().to_numpy() & self.df['Longitude'].notna().to_numpy())
+        left, right = near_pairs(self.df['Latitude'].to_numpy()[located], self.df['Longitude'].to_numpy()[located],
+                                 self.radius_m)
+        codes[located] = located[union_find(located.size, left, right)]
+        return codes, len(self.df)
+
+
+def _flagged(codes, rule):
+    # Lignes des groupes (même key) où distinct prend plusieurs valeurs :
+    # paires (groupe, valeur) distinctes, comptées par groupe
+    group, _ = codes.codes(rule['key'], key=True)
+    value, n_values = codes.codes(rule['distinct'])
+    both = (group >= 0) & (value >= 0)
+    pairs = pd.unique(group[both] * n_values + value[both])
+    counts = np.bincount(pairs // max(n_values, 1), minlength=group.max() + 1 if group.size else 0)
+    rows = np.flatnonzero(group >= 0)
+    rows = rows[counts[group[rows]] > 1]
+    return rows, group[rows]
+
+
+def _value(value):
+    # Cellule vide -> None (null en JSON)
+    return None if isinstance(value, float) and np.isnan(value) else value
+
+
+def duplicate_lines(df, first_row=DATA_START_ROW + 1, radius_m=None, rules=None):
+    # Toutes les règles de doublons en un passage sur les colonnes codées ;
+    # lignes triées par règle, groupe, puis ligne. Les groupes sont
+    # numérotés à la suite d'une règle à l'autre. Règles dont une colonne
+    # manque : ignorées (duplicate_rules).
+    df, _ = _coordonnees(df)
+    rules, _ = duplicate_rules(df.columns, rules)
+    codes = _Codes(df, rules, radius_m)
+    positions = df.index.to_numpy()
+    columns = {name: df[name].tolist() for name in df.columns}
+
+    results = []
+    last = 0
+    for rule in rules:
+        rows, groups = _flagged(codes, rule)
+        order = np.lexsort((positions[rows], groups))
+        rows = rows[order].tolist()
+        numbers = (pd.factorize(groups[order])[0] + 1 + last).tolist()
+        last = numbers[-1] if numbers else last
+        # Valeurs en conflit qui ne sont pas déjà affichées
+        shown = [name for name in rule['distinct'] if name not in ('Identifiant', 'Latitude', 'Longitude')]
+        for row, groupe in zip(rows, numbers):
+            line = {
+                "Ligne": int(positions[row]) + first_row,
+                "Identifiant": _value(columns['Identifiant'][row]),
+                "Latitude": _value(columns['Latitude'][row]),
+                "Longitude": _value(columns['Longitude'][row]),
+                "Groupe": groupe,
+                "Règle": rule['label']
+            }
+            if shown:
+                line["Valeur"] = " | ".join(str(_value(columns[name][row])) for name in shown)
+            results.append(line)
+    return results
+
+
+def find_duplicates(df, first_row=DATA_START_ROW + 1):
+    # Règles de doublons de rules.yaml (mêmes coordonnées, même
+    # identifiant...), valeurs identiques
+    return duplicate_lines(df, first_row)
+
+
+def find_near_duplicates(df, radius_m, first_row=DATA_START_ROW + 1):
+    # Idem, les coordonnées étant regroupées à radius_m mètres près
+    return duplicate_lines(df, first_row, radius_m)
@@ -0,0 +1,112 @@
+import math
+import re
+import zipfile
+
+from openpyxl import load_workbook
+from openpyxl.styles import PatternFill
+
+from highlight import highlight_rows, sheet_paths
+
+
+# ----------------------
+# CLASSEUR COLORÉ
+# ----------------------
+# Le fichier envoyé n'est analysé qu'une fois, pour les contrôles
+# (readers.py). Le classeur coloré est produit directement à partir du zip
+# d'origine (highlight.py), sans relire les cellules.
+def write_highlighted(input_path, output_path, sheet_name, highlights, reports=()):
+    # highlights : [(n° de lignes, couleur)], la première couleur l'emporte ;
+    # reports : [(titre, colonnes, lignes)], une feuille ajoutée par rapport
+    write_sheets(input_path, output_path, {sheet_name: highlights}, reports)
+
+
+def write_sheets(input_path, output_path, sheets, reports=()):
+    # Plusieurs feuilles colorées en une passe : nom -> highlights
+    try:
+        highlight_rows(input_path, output_path, sheets, reports)
+    except (KeyError, ValueError, zipfile.BadZipFile):
+        # Classeur atypique (styles ou relations absents) : passage par openpyxl
+        if hasattr(input_path, 'seek'):
+            input_path.seek(0)
+        wb = load_workbook(input_path)
+        for sheet_name, highlights in sheets.items():
+            for row_numbers, color in reversed(highlights):
+                fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+                fill_rows(wb[sheet_name], row_numbers, fill)
+        for title, columns, lines in reports:
+            name, k = title, 1
+            while name in wb.sheetnames:
+                k += 1
+                name = f"{title} ({k})"
+            ws = wb.create_sheet(name)
+            ws.append(columns)
+            for line in lines:
+                ws.append([_report_value(line.get(col)) for col in columns])
+        wb.save(output_path)
+
+
+def _report_value(value):
+    # Cellule vide plutôt que NaN (refusé par Excel)
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+
+def fill_rows(ws, row_numbers, fill):
+    # ws.max_column parcourt toutes les cellules : calculé une seule fois
+    max_col = ws.max_column
+    for row_num in sorted(set(row_numbers)):
+        for row in ws.iter_rows(min_row=row_num, max_row=row_num, max_col=max_col):
+            for cell in row:
+                cell.fill = fill
+
+
+# ----------------------
+# MÉTADONNÉES (sans lire les cellules)
+# ----------------------
+# Noms des feuilles (xl/workbook.xml) et taille déclarée par <dimension>,
+# qui se trouve en tête du XML de chaque feuille : seuls les premiers
+# octets sont décompressés, sharedStrings.xml n'est jamais ouvert.
+DIMENSION_RE = re.compile(rb'<(?:\w+:)?dimension\b[^>]*?\sref="([^"]+)"')
+SHEET_DATA_RE = re.compile(rb'<(?:\w+:)?sheetData\b')
+CELL_REF_RE = re.compile(r'([A-Z]+)(\d+)')
+HEAD_SIZE = 64 * 1024
+
+
+def _column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+def _dimension(zin, path):
+    # (lignes, colonnes) d'après <dimension ref="A1:AB5000">, sinon (None, None)
+    head = b''
+    with zin.open(path) as src:
+        while len(head) < HEAD_SIZE:
+            data = src.read(4096)
+            if not data:
+                break
+            head += data
+            match = DIMENSION_RE.search(head)
+            if match:
+                # Dernière cellule de la plage, comme max_row / max_column
+                refs = CELL_REF_RE.findall(match.group(1).decode('ascii').upper())
+                if not refs:
+                    break
+                last_col, last_row = refs[-1]
+                return int(last_row), _column_number(last_col)
+            if SHEET_DATA_RE.search(head):
+                break  # <dimension> précède toujours <sheetData>
+    return None, None
+
+
+def sheet_info(source):
+    with zipfile.ZipFile(source) as zin:
+        sheets = []
+        for name, path in sheet_paths(zin).items():
+            try:
+                rows, cols = _dimension(zin, path)
+            except KeyError:
+                rows, cols = None, None  # feuille déclarée mais absente du zip
+            sheets.append({'name': name, 'rows': rows, 'cols': cols})
+        return sheets